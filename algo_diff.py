@@ -0,0 +1,170 @@
+from json_stream import load_sections, NODE_SECTIONS
+from algo_graph import ANSWER, OTHER, SEQUENCE, kind_of
+
+###################
+# AlgoDiff class
+###################
+
+def to_id(key):
+    # JSON object keys are strings, epoct IDs integers
+    try:
+        return int(key)
+    except (TypeError, ValueError):
+        return key
+
+def items_of(section):
+    # {ID: item} of a section stored as an object keyed by ID or as a list
+    if isinstance(section, dict):
+        return {to_id(k): v for k, v in section.items()}
+    if isinstance(section, list):
+        return {to_id(v.get('id')): v for v in section if isinstance(v, dict)}
+    return {}
+
+def answers_of(node):
+    if not isinstance(node, dict):
+        return {}
+    return items_of(node.get('answers'))
+
+def label_text(item):
+    # Label of a JSON node or answer: a string or a {language: text} object
+    label = item.get('label') if isinstance(item, dict) else None
+    if isinstance(label, dict):
+        label = label.get('en', next(iter(label.values()), None))
+    return "" if label is None else str(label)
+
+def nested_members(graph, i):
+    # Members of sequence i and, recursively, of its nested sequences
+    found = set()
+    stack = list(graph.members(i))
+    while stack:
+        m = stack.pop()
+        if m not in found:
+            found.add(m)
+            if graph.getKind(m) == SEQUENCE:
+                stack.extend(graph.members(m))
+    return found
+
+def full_tree_indices(graph, i):
+    """AlgoGraph indices of the nodes read by the walk of the full tree of i.
+
+    Follows ClinicalAlgo.addFullSequence and addFullDiagnosis: the parents of
+    i and, for a sequence, its members and their parents; then every sequence
+    drawn as a parent brings its own parents, members and their parents. The
+    nested members of the member sequences are read for their start questions.
+    """
+    indices = {i}
+    expanded = set()
+    queue = []
+
+    def add_parents(j):
+        for p, _ in graph.parents(j):
+            indices.add(p)
+            if graph.getKind(p) == SEQUENCE and p not in expanded:
+                expanded.add(p)
+                queue.append(p)
+
+    def add_members(j):
+        for m in graph.members(j):
+            indices.add(m)
+            add_parents(m)
+            if graph.getKind(m) == SEQUENCE:
+                indices.update(nested_members(graph, m))
+
+    add_parents(i)
+    if graph.getKind(i) == SEQUENCE:
+        add_members(i)
+    while queue:
+        p = queue.pop()
+        add_parents(p)
+        add_members(p)
+    return indices
+
+class AlgoDiff():
+    """Node-level differences between two versions of a MedAL-C algorithm.
+
+    old and new are the loaded JSON data (see json_stream.load_sections).
+    Nodes are matched by section and ID, then reported by ID: an ID shared
+    by two sections is changed as soon as one of its entries is added,
+    removed or changed, so that its trees are re-rendered, never missed. An
+    entry is changed when any of its JSON differs, its answers included; the
+    answers of the changed entries are compared one by one.
+    """
+
+    def __init__(self, old, new, sections=NODE_SECTIONS):
+        old_nodes, new_nodes = {}, {}
+        for s in sections:
+            old_nodes.update({(s, i): v for i, v in items_of(old.get(s)).items()})
+            new_nodes.update({(s, i): v for i, v in items_of(new.get(s)).items()})
+        old_ids = {i for _, i in old_nodes}
+        new_ids = {i for _, i in new_nodes}
+        changed = {k for k in set(old_nodes) | set(new_nodes) if old_nodes.get(k) != new_nodes.get(k)}
+        self.added   = new_ids - old_ids
+        self.removed = old_ids - new_ids
+        self.changed = {i for _, i in changed} & old_ids & new_ids
+        # Per changed ID: {answer ID: status} and the (ID, label) of its removed answers
+        self._answers = {}
+        self._removed_answers = {}
+        for k in sorted(changed & set(old_nodes) & set(new_nodes), key=str):
+            i = k[1]
+            old_answers, new_answers = answers_of(old_nodes[k]), answers_of(new_nodes[k])
+            status = {a: 'added' for a in set(new_answers) - set(old_answers)}
+            status.update({a: 'changed' for a in set(old_answers) & set(new_answers) if old_answers[a] != new_answers[a]})
+            if status:
+                self._answers.setdefault(i, {}).update(status)
+            removed = sorted(set(old_answers) - set(new_answers), key=str)
+            if removed:
+                self._removed_answers.setdefault(i, []).extend((a, label_text(old_answers[a])) for a in removed)
+
+    @classmethod
+    def fromFiles(cls, old_path, new_path, sections=NODE_SECTIONS):
+        return cls(load_sections(old_path, sections), load_sections(new_path, sections), sections)
+
+    def changedIDs(self):
+        return self.added | self.removed | self.changed
+
+    def nodeStatus(self, node_id):
+        # 'added', 'changed' or None
+        if node_id in self.added:
+            return 'added'
+        if node_id in self.changed:
+            return 'changed'
+        return None
+
+    def answerStatus(self, node_id, answer_id):
+        return self._answers.get(node_id, {}).get(answer_id)
+
+    def removedAnswers(self, node_id):
+        return self._removed_answers.get(node_id, [])
+
+    def treeIndices(self, n, index, mode):
+        # AlgoGraph indices of the nodes the tree of n in mode is drawn from
+        graph = index.getGraph()
+        roots = [n]
+        if mode == "mdfocus" and kind_of(n) == OTHER:
+            # Chief complaint trees are made of those of its main diagnoses
+            roots = index.getMainDiagnosesOf(n.getID())
+        indices = set()
+        for r in roots:
+            i = graph.lookup(r)
+            if i is None:
+                continue
+            if mode == "full":
+                # Full trees are only drawn by the walk, whose reads are followed here
+                indices.update(full_tree_indices(graph, i))
+                continue
+            indices.add(i)
+            for _, child, parent, answer in graph.view(r, mode).items:
+                indices.update(j for j in (child, parent, answer) if j >= 0)
+        return indices
+
+    def affects(self, n, index, mode):
+        changed = self.changedIDs()
+        if n.getID() in changed:
+            return True
+        graph = index.getGraph()
+        return any(graph.getKind(i) != ANSWER and graph.getObject(i).getID() in changed for i in self.treeIndices(n, index, mode))
+
+    def affected(self, nodes, index, mode):
+        # The nodes whose tree in mode draws an added or changed node; removed
+        # nodes show as changes of the nodes that referred to them
+        return [n for n in nodes if self.affects(n, index, mode)]
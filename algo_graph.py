@@ -0,0 +1,310 @@
+from array import array
+from libs import epoct
+
+###################
+# AlgoGraph class
+###################
+
+QUESTION  = 'question'
+SEQUENCE  = 'sequence'
+DIAGNOSIS = 'diagnosis'
+FINAL     = 'final'
+ANSWER    = 'answer'
+OTHER     = 'other'
+
+# Questions left out of the diagnosis views, as in ClinicalAlgo.addParentQuestions
+EXCLUDED_CATEGORIES = ["management", "treatment_question"]
+
+def kind_of(n):
+    if type(n) is epoct.Question:
+        return QUESTION
+    elif type(n) is epoct.QuestionSequence:
+        return SEQUENCE
+    elif type(n) is epoct.DiagnosisSequence:
+        return DIAGNOSIS
+    elif type(n) is epoct.FinalDiagnosis:
+        return FINAL
+    return OTHER
+
+def to_csr(lists, width=1):
+    # Freeze per-node lists into offsets + flat arrays (one per tuple field)
+    ptr = array('l', [0])
+    cols = [array('l') for _ in range(width)]
+    for items in lists:
+        for item in items:
+            if width == 1:
+                cols[0].append(item)
+            else:
+                for col, v in zip(cols, item):
+                    col.append(v)
+        ptr.append(len(cols[0]))
+    return ptr, cols
+
+class View():
+    """Subgraph of an AlgoGraph drawn as one tree.
+
+    items lists (kind, child, parent, answer) tuples in drawing order, each
+    once: kind 'node' for a final diagnosis or chief complaint drawn on its
+    own (parent and answer are -1), 'answer' for a dependency of child on an
+    answer of parent, 'excludes' for a final diagnosis (child) excluding
+    another (parent; answer is -1).
+    """
+
+    def __init__(self, root):
+        self.root  = root
+        self.items = []
+        self._seen = set()
+
+    def addNode(self, i):
+        self.add('node', i, -1, -1)
+
+    def addEdge(self, kind, child, parent, answer):
+        self.add(kind, child, parent, answer)
+
+    def add(self, kind, child, parent, answer):
+        item = (kind, child, parent, answer)
+        if item not in self._seen:
+            self._seen.add(item)
+            self.items.append(item)
+
+class AlgoGraph():
+    """Dependency graph of the whole algorithm, built once from an AlgoIndex.
+
+    Every question, question sequence, diagnosis, final diagnosis, chief
+    complaint and answer gets an integer index; nodes are identified by their
+    kind and epoct ID, question sequences by the extracted (index) object.
+    The links are stored as CSR adjacency arrays: parents (with the answer
+    leading to the child), members of the sequences and diagnoses (main and
+    final), answers of each question, excluded final diagnoses and the
+    reverse dependents.
+    view() extracts the subgraph of one tree by a bounded traversal that
+    visits every node and link at most once.
+    """
+
+    def __init__(self, index):
+        self._index   = index
+        self._objects = []
+        self._kinds   = []
+        self._lookup  = {}
+        parents, members, answers, excluded, owner = [], [], [], [], []
+
+        def new(n, kind):
+            i = len(self._objects)
+            self._lookup[(kind, n.getID())] = i
+            self._objects.append(n)
+            self._kinds.append(kind)
+            for links in (parents, members, answers, excluded, owner):
+                links.append([])
+            return i
+
+        def add(n):
+            # Index of node n, queued for walking the first time it is seen
+            kind = kind_of(n)
+            i = self._lookup.get((kind, n.getID()))
+            if i is None:
+                if kind == SEQUENCE:
+                    n = index.getSequence(n.getID()) or n
+                i = new(n, kind)
+                stack.append(i)
+            return i
+
+        def add_answer(a):
+            i = self._lookup.get((ANSWER, a.getID()))
+            if i is None:
+                i = new(a, ANSWER)
+            return i
+
+        stack = []
+        roots = list(index.getMainDiagnoses()) + list(index.getFinalDiagnoses()) + list(index.getQuestionSequences())
+        for r in roots:
+            add(r)
+            # Walk each root's component before the next root, so that indices
+            # follow the extraction order
+            while stack:
+                i = stack.pop()
+                n = self._objects[i]
+                kind = self._kinds[i]
+                if kind in (QUESTION, SEQUENCE):
+                    answers[i] = [add_answer(a) for a in n.getChildren()]
+                parents[i] = [(add(q), add_answer(a)) for q, a in zip(n.getGrandParents(), n.getParents())]
+                if kind in (SEQUENCE, DIAGNOSIS, FINAL):
+                    members[i] = [add(s) for s in n.getSeq()]
+                if kind == FINAL:
+                    excluded[i] = [add(efd) for efd in n.getExcludedFinalDiagnoses()]
+                    if n.getMainDiagnosis() is not None:
+                        owner[i] = [add(n.getMainDiagnosis())]
+                elif kind == DIAGNOSIS and n.getChiefComplaint() is not None:
+                    owner[i] = [add(n.getChiefComplaint())]
+
+        # Reverse links: the nodes depending on each node, and the final
+        # diagnoses of each main diagnosis
+        dependents = [[] for _ in self._objects]
+        finals = [[] for _ in self._objects]
+        for i, links in enumerate(parents):
+            for p, a in links:
+                dependents[p].append((i, a))
+        for fd in index.getFinalDiagnoses():
+            i = self._lookup[(FINAL, fd.getID())]
+            if owner[i] and i not in finals[owner[i][0]]:
+                finals[owner[i][0]].append(i)
+
+        self._parent_ptr, (self._parent_node, self._parent_answer) = to_csr(parents, 2)
+        self._member_ptr, (self._member_node,) = to_csr(members)
+        self._answer_ptr, (self._answer_node,) = to_csr(answers)
+        self._excluded_ptr, (self._excluded_node,) = to_csr(excluded)
+        self._owner_ptr, (self._owner_node,) = to_csr(owner)
+        self._dependent_ptr, (self._dependent_node, self._dependent_answer) = to_csr(dependents, 2)
+        self._final_ptr, (self._final_node,) = to_csr(finals)
+
+    def size(self):
+        return len(self._objects)
+
+    def lookup(self, n):
+        # Graph index of an epoct node (None if it is not part of the algorithm)
+        kind = kind_of(n)
+        return self._lookup.get((kind, n.getID()))
+
+    def lookupAnswer(self, answer_id):
+        return self._lookup.get((ANSWER, answer_id))
+
+    def getObject(self, i):
+        return self._objects[i]
+
+    def getKind(self, i):
+        return self._kinds[i]
+
+    def parents(self, i):
+        # (parent, answer) pairs i depends on
+        start, end = self._parent_ptr[i], self._parent_ptr[i + 1]
+        return list(zip(self._parent_node[start:end], self._parent_answer[start:end]))
+
+    def dependents(self, i):
+        # (child, answer) pairs depending on an answer of i
+        start, end = self._dependent_ptr[i], self._dependent_ptr[i + 1]
+        return list(zip(self._dependent_node[start:end], self._dependent_answer[start:end]))
+
+    def members(self, i):
+        return self._member_node[self._member_ptr[i]:self._member_ptr[i + 1]].tolist()
+
+    def answers(self, i):
+        return self._answer_node[self._answer_ptr[i]:self._answer_ptr[i + 1]].tolist()
+
+    def excluded(self, i):
+        return self._excluded_node[self._excluded_ptr[i]:self._excluded_ptr[i + 1]].tolist()
+
+    def owner(self, i):
+        # Main diagnosis of a final diagnosis, chief complaint of a main diagnosis
+        owners = self._owner_node[self._owner_ptr[i]:self._owner_ptr[i + 1]]
+        return owners[0] if owners else None
+
+    def finals(self, i):
+        return self._final_node[self._final_ptr[i]:self._final_ptr[i + 1]].tolist()
+
+    def ancestors(self, i, depth=None):
+        """Indices of the nodes i depends on, breadth first, i excluded.
+
+        Follows parent links and, from sequences and diagnoses, their members;
+        depth bounds the number of links followed (None: no bound).
+        """
+        seen = {i}
+        order = []
+        frontier = [i]
+        level = 0
+        while frontier and (depth is None or level < depth):
+            level += 1
+            nxt = []
+            for j in frontier:
+                linked = [p for p, _ in self.parents(j)]
+                if self._kinds[j] in (SEQUENCE, DIAGNOSIS):
+                    linked += self.members(j)
+                for p in linked:
+                    if p not in seen:
+                        seen.add(p)
+                        order.append(p)
+                        nxt.append(p)
+            frontier = nxt
+        return order
+
+    ###################
+    # Views
+    ###################
+
+    def view(self, n, mode):
+        """Extract the tree of node n in mode 'short' or 'mdfocus'.
+
+        short:   links of n, and of its member questions for a sequence, or
+                 only the links of its members for a diagnosis
+        mdfocus: the diagnosis links of n with its final diagnoses, their chief
+                 complaint, links and exclusions
+        Management and treatment questions are left out.
+        Full trees link sequences through their answers and start questions,
+        which the graph does not model: they are only drawn by the walk
+        (ValueError). Raises KeyError for a node outside the algorithm.
+        """
+        if mode not in ("short", "mdfocus"):
+            raise ValueError("No {} view: full trees are drawn by the walk builder".format(mode))
+        i = self.lookup(n)
+        if i is None:
+            raise KeyError("{} {} is not part of the algorithm graph".format(type(n).__name__, n.getID()))
+        v = View(i)
+        kind = self._kinds[i]
+        if mode == "short":
+            if kind == SEQUENCE:
+                self._addLinks(v, i, True)
+                for m in self.members(i):
+                    if self._kinds[m] == QUESTION:
+                        self._addLinks(v, m, True)
+            elif kind == DIAGNOSIS:
+                self._addMemberLinks(v, i, True)
+            else:
+                self._addLinks(v, i, True)
+        else:
+            self._addMemberLinks(v, i, True)
+            for fd in self.finals(i):
+                self._addFinalDiagnosis(v, fd)
+        return v
+
+    def mergedView(self, final_diagnoses):
+        """Extract the union of the trees of several final diagnoses.
+
+        Each final diagnosis comes with the links of its members, as in short
+        diagnosis views, then its own links; shared nodes and links appear once.
+        """
+        v = View(None)
+        for n in final_diagnoses:
+            i = self.lookup(n)
+            v.addNode(i)
+            self._addMemberLinks(v, i, True)
+            self._addLinks(v, i, True)
+        return v
+
+    def _addFinalDiagnosis(self, v, fd):
+        owner = self.owner(fd)
+        cc = self.owner(owner) if owner is not None else None
+        if cc is not None:
+            v.addNode(cc)
+        v.addNode(fd)
+        self._addLinks(v, fd, True)
+        for efd in self.excluded(fd):
+            v.addNode(efd)
+            v.addEdge('excludes', fd, efd, -1)
+
+    def _addLinks(self, v, i, filtered=False):
+        for p, a in self.parents(i):
+            if filtered and self._excluded(p):
+                continue
+            v.addEdge('answer', i, p, a)
+
+    def _addMemberLinks(self, v, i, filtered):
+        # As ClinicalAlgo.addSequenceQuestions: only the questions and sequences
+        # of the sequence, the excluded categories filtered out of the questions
+        for m in self.members(i):
+            kind = self._kinds[m]
+            if kind == QUESTION and filtered and self._excluded(m):
+                continue
+            if kind in (QUESTION, SEQUENCE):
+                self._addLinks(v, m, filtered)
+
+    def _excluded(self, i):
+        # Management and treatment questions, left out whatever their type
+        return self._objects[i].getCategory() in EXCLUDED_CATEGORIES
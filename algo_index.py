@@ -0,0 +1,119 @@
+from libs import epoct
+from algo_graph import AlgoGraph
+
+###################
+# AlgoIndex class
+###################
+
+class AlgoIndex():
+    """Lookup tables over the extracted node structure.
+
+    Built once after extract_nodes and shared by every ClinicalAlgo of a run,
+    so that finding a question sequence by ID, the final diagnoses of a main
+    diagnosis or the main diagnoses of a chief complaint is a dict lookup
+    instead of a scan over the full node lists.
+    """
+
+    def __init__(self, main_diagnoses, final_diagnoses, question_seqs):
+        self._analysed        = {}
+        self._graph           = None
+        self._reachability    = None
+        self._main_diagnoses  = list(main_diagnoses)
+        self._final_diagnoses = list(final_diagnoses)
+        self._question_seqs   = list(question_seqs)
+
+        # ID -> question sequence (the first one wins, as with the former scans)
+        self._seq_by_id = {}
+        for qs in self._question_seqs:
+            self._seq_by_id.setdefault(qs.getID(), qs)
+
+        # Main diagnosis ID -> final diagnoses, in extraction order
+        self._fds_by_md = {}
+        for fd in self._final_diagnoses:
+            self._fds_by_md.setdefault(fd.getMainDiagnosis().getID(), []).append(fd)
+
+        # Chief complaint ID -> main diagnoses, in extraction order
+        self._mds_by_cc = {}
+        for md in self._main_diagnoses:
+            self._mds_by_cc.setdefault(md.getChiefComplaint().getID(), []).append(md)
+
+    def getMainDiagnoses(self):
+        return self._main_diagnoses
+
+    def getFinalDiagnoses(self):
+        return self._final_diagnoses
+
+    def getQuestionSequences(self):
+        return self._question_seqs
+
+    def getSequence(self, seq_id):
+        return self._seq_by_id.get(seq_id)
+
+    def getFinalDiagnosesOf(self, md_id):
+        return self._fds_by_md.get(md_id, [])
+
+    def getMainDiagnosesOf(self, cc_id):
+        return self._mds_by_cc.get(cc_id, [])
+
+    def getGraph(self):
+        # Dependency graph of the whole algorithm, built on first use
+        if self._graph is None:
+            self._graph = AlgoGraph(self)
+        return self._graph
+
+    def getReachability(self):
+        # Transitive dependencies of the graph; needs NumPy and SciPy
+        if self._reachability is None:
+            from reachability import Reachability
+            self._reachability = Reachability(self.getGraph())
+        return self._reachability
+
+    def analyseSequence(self, s):
+        """Return the parent IDs and the start nodes of question sequence s.
+
+        The parent IDs are those of the sequence's grand parents, the start
+        nodes the questions without parents found by walking the sequence and,
+        recursively, its nested sequences. Results are memoized per sequence
+        ID for the lifetime of the index, so a batch resolves each sequence
+        once. The walk uses an explicit stack and raises ValueError on a
+        sequence that (indirectly) contains itself.
+        """
+        if s.getID() not in self._analysed:
+            self._resolveSequence(s)
+        return self._analysed[s.getID()]
+
+    def _resolveSequence(self, s):
+        # Each frame holds: sequence, its members, next member position, start nodes found so far
+        stack = [self._sequenceFrame(s)]
+        path = [s.getID()]
+        while stack:
+            frame = stack[-1]
+            qs, members, pos, start_nodes = frame
+            if pos < len(members):
+                frame[2] = pos + 1
+                n = members[pos]
+                if type(n) is epoct.Question:
+                    if not n.getGrandParents():
+                        start_nodes.append(n)
+                elif type(n) is epoct.QuestionSequence:
+                    if n.getID() in self._analysed:
+                        start_nodes.extend(self._analysed[n.getID()][1])
+                    elif n.getID() in path:
+                        cycle = path[path.index(n.getID()):] + [n.getID()]
+                        raise ValueError("Cyclic question sequence: {}".format(" -> ".join(str(i) for i in cycle)))
+                    else:
+                        stack.append(self._sequenceFrame(n))
+                        path.append(n.getID())
+            else:
+                stack.pop()
+                path.pop()
+                self._analysed[qs.getID()] = (frozenset(gp.getID() for gp in qs.getGrandParents()), tuple(start_nodes))
+                if stack:
+                    stack[-1][3].extend(start_nodes)
+
+    def _sequenceFrame(self, s):
+        # Prefer the extracted sequence, which carries the full node sequence
+        qs = self.getSequence(s.getID())
+        if qs is None:
+            qs = s
+        return [qs, list(qs.getSeq()), 0, []]
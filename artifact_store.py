@@ -0,0 +1,158 @@
+import os
+import shutil
+import threading
+
+from snapshot import file_hash
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows: no reflinks, hardlinks or copies only
+    fcntl = None
+
+# ioctl cloning a whole file on copy-on-write filesystems (Btrfs, XFS...)
+FICLONE = 0x40049409
+
+###################
+# ArtifactStore class
+###################
+
+def reflink(src, dst):
+    # Copy-on-write clone of src as dst; raises OSError where unsupported
+    if fcntl is None:
+        raise OSError("reflinks are not supported on this platform")
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.remove(dst)
+            raise
+
+def temp_name(path):
+    # Unique per process and thread: layouts may store outputs from threads
+    return "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+
+def place(src, dst, hardlink=True):
+    """Make dst a reflink of src, or a hardlink, or else a copy.
+
+    Returns the method used: 'reflink', 'hardlink' or 'copy'. Hardlinks fail
+    across filesystems, where the copy takes over; without hardlink, dst never
+    shares the inode of src.
+    """
+    try:
+        reflink(src, dst)
+        return 'reflink'
+    except OSError:
+        pass
+    if hardlink:
+        try:
+            os.link(src, dst)
+            return 'hardlink'
+        except OSError:
+            pass
+    shutil.copyfile(src, dst)
+    return 'copy'
+
+class ArtifactStore():
+    """Output files stored once, by the SHA-256 of their content.
+
+    add() stores a reflink or a copy of a rendered file, never a hardlink:
+    the file stays its own, and rewriting it in place (as the renderers do)
+    leaves the object intact. Where reflinks are supported, byte-identical
+    renders of several output directories are turned into reflinks of one
+    object. link() materializes a stored file elsewhere (exports) as a
+    reflink, a hardlink or, across filesystems, a copy; nothing writes to the
+    exports, which are replaced, not rewritten. prune() removes the objects
+    no export links to any more.
+    """
+
+    def __init__(self, store_dir):
+        self._dir = store_dir
+        os.makedirs(self._dir, exist_ok=True)
+        self._counts = {'reflink': 0, 'hardlink': 0, 'copy': 0, 'unchanged': 0}
+        # Files may be linked from several threads (exports, layouts)
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Sent to the render_batch worker processes: the lock stays here
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def getDir(self):
+        return self._dir
+
+    def objectPath(self, digest):
+        return os.path.join(self._dir, digest[:2], digest)
+
+    def add(self, path):
+        # Store the content of path and return its digest
+        digest = file_hash(path)
+        obj = self.objectPath(digest)
+        if not os.path.exists(obj):
+            os.makedirs(os.path.dirname(obj), exist_ok=True)
+            tmpfile = temp_name(obj)
+            place(path, tmpfile, hardlink=False)
+            os.replace(tmpfile, obj)
+        else:
+            # Share the blocks of the object, copy-on-write
+            tmpfile = temp_name(path)
+            try:
+                reflink(obj, tmpfile)
+            except OSError:
+                pass
+            else:
+                os.replace(tmpfile, path)
+        return digest
+
+    def link(self, src, dest):
+        # Make dest share the content of src, an object or a stored file
+        if os.path.exists(dest) and os.path.samefile(src, dest):
+            method = 'unchanged'
+        else:
+            tmpfile = temp_name(dest)
+            method = place(src, tmpfile)
+            os.replace(tmpfile, dest)
+        with self._lock:
+            self._counts[method] += 1
+        return method
+
+    def export(self, path, dest):
+        # Store path if needed and link dest to its object
+        return self.link(self.objectPath(self.add(path)), dest)
+
+    def release(self, path):
+        # Unlink path if it shares its inode with an object (outputs stored by
+        # earlier versions of the store), before rewriting it
+        try:
+            if os.stat(path).st_nlink > 1:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def prune(self):
+        # Remove the objects without any other link (exports), left behind by
+        # re-rendered trees; returns the number of objects removed
+        removed = 0
+        for root, dirs, files in os.walk(self._dir):
+            for name in files:
+                # Objects being written by another process are left alone
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    if os.stat(path).st_nlink == 1:
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def getCounts(self):
+        # Files linked per method since the store was opened
+        return dict(self._counts)
@@ -0,0 +1,69 @@
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+###################
+# Batch rendering
+###################
+
+# Per-process rendering context, set once by the pool initializer so that the
+# algorithm objects are shipped to each worker a single time (and keep their
+# shared references) instead of being pickled again for every node.
+_render = None
+_nodes  = []
+_args   = ()
+
+def _init_worker(render, nodes, args):
+    global _render, _nodes, _args
+    _render = render
+    _nodes  = nodes
+    _args   = args
+
+def _render_index(i):
+    try:
+        return _render(_nodes[i], *_args), None
+    except Exception:
+        return None, traceback.format_exc()
+
+def render_batch(render, nodes, args, workers=1, on_result=None):
+    """Call render(n, *args) for every node, serially or on a process pool.
+
+    render must be a module-level function so it can be sent to the workers;
+    it may return a dict whose 'timings' entry (seconds per stage) is printed
+    with the node. on_result(n, result) is called in this process for every
+    node rendered successfully.
+    workers=None uses one process per core. Results are collected in input
+    order, so the log is identical whatever the number of workers, and a
+    failing node is reported without aborting the rest of the batch.
+    Returns the list of (node, traceback) pairs for the failed nodes.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers > 1 and len(nodes) > 1:
+        pool = ProcessPoolExecutor(max_workers=min(workers, len(nodes)), initializer=_init_worker, initargs=(render, nodes, args))
+        with pool:
+            return _collect(nodes, pool.map(_render_index, range(len(nodes))), on_result)
+    _init_worker(render, nodes, args)
+    return _collect(nodes, map(_render_index, range(len(nodes))), on_result)
+
+def _collect(nodes, results, on_result=None):
+    failures = []
+    for n, (result, err) in zip(nodes, results):
+        if err is None:
+            print("{} - {}{}".format(n.getID(), n.getReference(), _format_timings((result or {}).get('timings'))))
+            if on_result is not None:
+                on_result(n, result)
+        else:
+            print("{} - {} FAILED".format(n.getID(), n.getReference()))
+            failures.append((n, err))
+    if failures:
+        print("{} of {} trees failed:".format(len(failures), len(nodes)))
+        for n, err in failures:
+            print("--- {} - {}".format(n.getID(), n.getReference()))
+            print(err)
+    return failures
+
+def _format_timings(timings):
+    if not timings:
+        return ""
+    return " ({})".format(", ".join("{} {:.2f}s".format(k, v) for k, v in timings.items()))
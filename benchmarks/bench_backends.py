@@ -0,0 +1,66 @@
+"""Compare the 'agraph' and 'stream' drawing backends of ClinicalAlgo.
+
+Renders the same trees of the MedAL-C algorithm (definitions.JSON_PATH) with
+both backends into a temporary directory and prints the build, draw and
+layout times per backend. Run from the repository root:
+
+    python -m benchmarks.bench_backends [--mode mdfocus] [--nodes cc] [--repeat 3]
+"""
+import os
+import time
+import argparse
+import tempfile
+
+from definitions import JSON_PATH, CLINICAL_KEYS_PATH
+from utils import loadDiagnosisSeverity2
+from libs import algoreader
+from libs import read_epoct_json2
+from algo_index import AlgoIndex
+from generate_trees import ClinicalAlgo
+
+BACKENDS = ['agraph', 'stream']
+
+def load_index():
+    severity_df = loadDiagnosisSeverity2(CLINICAL_KEYS_PATH, 'DYNAMIC diagnoses')
+    data = algoreader.AlgoReader(JSON_PATH).getData()
+    mds, fds, ccs, qss = read_epoct_json2.extract_nodes(data, severity_df)
+    return AlgoIndex(mds, fds, qss), {'md': mds, 'fd': fds, 'cc': ccs, 'qs': qss}
+
+def bench_backend(backend, nodes, index, outdir, mode, repeat):
+    # Best of repeat runs of the whole node list, per stage
+    best = {}
+    for _ in range(repeat):
+        totals = {}
+        start = time.perf_counter()
+        for n in nodes:
+            g = ClinicalAlgo(index, horizontal=False, backend=backend)
+            g.createTree(n, outdir, mode)
+            for stage, t in g.getTimings().items():
+                totals[stage] = totals.get(stage, 0.0) + t
+        totals['total'] = time.perf_counter() - start
+        for stage, t in totals.items():
+            best[stage] = min(best.get(stage, t), t)
+    return best
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', default='mdfocus', choices=['short', 'full', 'mdfocus'])
+    parser.add_argument('--nodes', default='cc', choices=['cc', 'md', 'fd', 'qs'])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    index, nodes = load_index()
+    nodes = nodes[args.nodes]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for backend in BACKENDS:
+            outdir = os.path.join(tmpdir, backend)
+            os.makedirs(outdir)
+            results[backend] = bench_backend(backend, nodes, index, outdir, args.mode, args.repeat)
+
+    print("{} {} trees, best of {}".format(len(nodes), args.mode, args.repeat))
+    stages = [s for s in results['agraph'] if s != 'total'] + ['total']
+    print("{:<10}".format("stage") + "".join("{:>10}".format(b) for b in BACKENDS))
+    for stage in stages:
+        print("{:<10}".format(stage) + "".join("{:>9.2f}s".format(results[b].get(stage, 0.0)) for b in BACKENDS))
+    print("speedup   {:>9.2f}x".format(results['agraph']['total'] / results['stream']['total']))
@@ -0,0 +1,79 @@
+"""Compare json.load with the streaming loader of json_stream on an algorithm file.
+
+Loads the MedAL-C file (--json, or a synthetic file of about --size MB with
+large media and translation sections) with json.load and with
+json_stream.load_sections, checks that both give the same node sections
+and prints the parse time and the peak Python memory (tracemalloc, measured
+in a separate run) of each. Run from the repository root:
+
+    python -m benchmarks.bench_json --size 200
+    python -m benchmarks.bench_json --json path/to/medal_c.json
+"""
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+import json_stream
+from json_stream import load_sections, ALGORITHM_KEYS, NODE_SECTIONS
+
+def write_synthetic(path, size_mb, seed=0):
+    # Metadata, filler sections up to size_mb, then node sections of a few MB
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf8') as f:
+        f.write('{')
+        for k in ALGORITHM_KEYS:
+            f.write('{}: {}, '.format(json.dumps(k), json.dumps("{} value".format(k))))
+        # Embedded media and translations, the bulk of newer files
+        f.write('"medias": [')
+        chunk = json.dumps({'name': "image", 'data': "".join(rng.choice("ABCDEFGH") for _ in range(1 << 16))})
+        for i in range(max(1, size_mb * (1 << 20) // len(chunk))):
+            f.write(("," if i else "") + chunk)
+        f.write('], ')
+        nodes = {str(i): {'id': i, 'type': 'Question', 'label': {'en': "Question {}".format(i)}, 'answers': {str(i * 10 + a): {'id': i * 10 + a, 'label': {'en': "answer {}".format(a)}} for a in range(3)}} for i in range(5000)}
+        f.write('"nodes": {}, '.format(json.dumps(nodes)))
+        f.write('"diagnostics": {}, '.format(json.dumps({str(i): {'id': i, 'label': {'en': "Diagnosis {}".format(i)}, 'instances': list(range(i, i + 20))} for i in range(200)})))
+        f.write('"final_diagnostics": {}}}'.format(json.dumps({str(i): {'id': i, 'diagnostic_id': i % 200, 'label': {'en': "Final diagnosis {}".format(i)}} for i in range(800)})))
+
+def run_loader(load, path, trace):
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    data = load(path)
+    elapsed = time.perf_counter() - start
+    peak = None
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return data, elapsed, peak
+
+def json_load(path):
+    with open(path, encoding='utf8') as f:
+        return json.load(f)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--json', help="algorithm file (default: a synthetic one)")
+    parser.add_argument('--size', type=int, default=200, help="size of the synthetic file, in MB")
+    args = parser.parse_args()
+
+    if json_stream.ijson is None:
+        print("ijson is not installed: load_sections falls back to json.load")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = args.json
+        if path is None:
+            path = os.path.join(tmpdir, "algorithm.json")
+            write_synthetic(path, args.size)
+        print("{}: {:.0f} MB".format(path, os.path.getsize(path) / 2**20))
+        print("{:<15}{:>10}{:>14}".format("loader", "time", "peak memory"))
+        results = {}
+        for name, load in [('json.load', json_load), ('load_sections', load_sections)]:
+            data, elapsed, _ = run_loader(load, path, False)
+            results[name] = {k: data.get(k) for k in NODE_SECTIONS}
+            del data
+            _, _, peak = run_loader(load, path, True)
+            print("{:<15}{:>9.2f}s{:>10.0f} MiB".format(name, elapsed, peak / 2**20))
+        print("same node sections: {}".format(results['json.load'] == results['load_sections']))
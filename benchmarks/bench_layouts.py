@@ -0,0 +1,134 @@
+"""Compare layout strategies on the largest trees of a synthetic algorithm.
+
+The trees of one mode are built once with the 'stream' backend; the --trees
+largest are then laid out by Graphviz with each strategy of STRATEGIES
+(see layout_strategy). For every strategy the layout time is reported along
+with quality measures read from the plain output: drawing area, total edge
+length and edge crossings (between the control polygons of the edges, a
+close proxy of the drawn curves). Needs Graphviz on the PATH. Run from the
+repository root:
+
+    python -m benchmarks.bench_layouts --mode full --nodes qs --trees 5
+"""
+import os
+import time
+import shlex
+import argparse
+import tempfile
+import subprocess
+
+from algo_index import AlgoIndex
+from benchmarks.synthetic import synthetic_algorithm
+from benchmarks.bench_trees import GENERATOR_PARAMS
+from generate_trees import ClinicalAlgo
+
+# Name and layout overrides (None: dot with spline routing, {}: automatic)
+STRATEGIES = [
+    ('spline', None),
+    ('auto', {}),
+    ('polyline', {'splines': 'polyline'}),
+    ('polyline-fast', {'splines': 'polyline', 'nslimit': '1', 'nslimit1': '1', 'mclimit': '0.1', 'searchsize': '20'}),
+    ('line', {'splines': 'false'}),
+    ('ortho', {'splines': 'ortho'}),
+]
+
+def build_trees(nodes, index, mode, outdir, strategy):
+    # DOT file, size and engine of every tree, drawn without being laid out
+    trees = []
+    for k, n in enumerate(nodes):
+        g = ClinicalAlgo(index, horizontal=False, backend='stream', layout=strategy)
+        g.buildTree(n, mode)
+        dotfile = os.path.join(outdir, "{}.dot".format(k))
+        g.draw(dotfile)
+        prog, _ = g.getLayout()
+        trees.append({'dotfile': dotfile, 'nodes': len(g.getNodes()) + 1, 'edges': len(g.getEdges()), 'prog': prog})
+    return trees
+
+def parse_plain(text):
+    # Drawing size and edge control polygons of Graphviz plain output
+    width = height = 0.0
+    edges = []
+    for line in text.splitlines():
+        if line.startswith('graph '):
+            _, _, width, height = line.split()[:4]
+            width, height = float(width), float(height)
+        elif line.startswith('edge '):
+            fields = shlex.split(line)
+            tail, head, count = fields[1], fields[2], int(fields[3])
+            coords = [float(v) for v in fields[4:4 + 2 * count]]
+            edges.append((tail, head, list(zip(coords[::2], coords[1::2]))))
+    return width, height, edges
+
+def edge_length(points):
+    return sum(((x2 - x1) ** 2 + (y2 - y1) ** 2) ** 0.5 for (x1, y1), (x2, y2) in zip(points, points[1:]))
+
+def segments_cross(p1, p2, p3, p4):
+    def orient(a, b, c):
+        return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+    d1, d2 = orient(p3, p4, p1), orient(p3, p4, p2)
+    d3, d4 = orient(p1, p2, p3), orient(p1, p2, p4)
+    return d1 * d2 < 0 and d3 * d4 < 0
+
+def crossings(edges):
+    # Pairs of edges without a common end whose control polygons cross
+    segments = [(tail, head, list(zip(points, points[1:]))) for tail, head, points in edges]
+    count = 0
+    for i, (t1, h1, s1) in enumerate(segments):
+        for t2, h2, s2 in segments[i + 1:]:
+            if {t1, h1} & {t2, h2}:
+                continue
+            if any(segments_cross(a, b, c, d) for a, b in s1 for c, d in s2):
+                count += 1
+    return count
+
+def bench_strategy(trees, timeout):
+    result = {'time': 0.0, 'area': 0.0, 'length': 0.0, 'crossings': 0, 'timeouts': 0}
+    for tree in trees:
+        start = time.perf_counter()
+        try:
+            out = subprocess.run([tree['prog'], '-Tplain', tree['dotfile']], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=timeout, check=True)
+        except subprocess.TimeoutExpired:
+            result['time'] += timeout
+            result['timeouts'] += 1
+            continue
+        result['time'] += time.perf_counter() - start
+        width, height, edges = parse_plain(out.stdout.decode('utf8', 'replace'))
+        result['area'] += width * height
+        result['length'] += sum(edge_length(points) for _, _, points in edges)
+        result['crossings'] += crossings(edges)
+    return result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', default='full', choices=['short', 'full', 'mdfocus'])
+    parser.add_argument('--nodes', default='qs', choices=['cc', 'md', 'fd', 'qs'])
+    parser.add_argument('--trees', type=int, default=5, help="number of largest trees laid out")
+    parser.add_argument('--timeout', type=float, default=300, help="seconds per layout")
+    parser.add_argument('--n-cc', dest='n_cc', type=int, default=4)
+    parser.add_argument('--mds-per-cc', dest='mds_per_cc', type=int, default=8)
+    parser.add_argument('--fds-per-md', dest='fds_per_md', type=int, default=4)
+    parser.add_argument('--n-questions', dest='n_questions', type=int, default=1500)
+    parser.add_argument('--n-sequences', dest='n_sequences', type=int, default=150)
+    parser.add_argument('--seq-depth', dest='seq_depth', type=int, default=4)
+    parser.add_argument('--answers-per-question', dest='answers_per_question', type=int, default=3)
+    parser.add_argument('--parents-per-node', dest='parents_per_node', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    mds, fds, ccs, qss = synthetic_algorithm(**{p: getattr(args, p) for p in GENERATOR_PARAMS})
+    index = AlgoIndex(mds, fds, qss)
+    nodes = {'md': mds, 'fd': fds, 'cc': ccs, 'qs': qss}[args.nodes]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Select the largest trees once, then draw them with every strategy
+        sizes = build_trees(nodes, index, args.mode, tmpdir, None)
+        largest = sorted(range(len(nodes)), key=lambda k: sizes[k]['edges'], reverse=True)[:args.trees]
+        nodes = [nodes[k] for k in largest]
+        print("{} largest {} trees: {} nodes, {} edges".format(len(nodes), args.mode, sum(sizes[k]['nodes'] for k in largest), sum(sizes[k]['edges'] for k in largest)))
+        print("{:<14}{:>10}{:>12}{:>12}{:>11}{:>10}".format("strategy", "layout", "area", "length", "crossings", "timeouts"))
+        for name, strategy in STRATEGIES:
+            outdir = os.path.join(tmpdir, name)
+            os.makedirs(outdir)
+            trees = build_trees(nodes, index, args.mode, outdir, strategy)
+            r = bench_strategy(trees, args.timeout)
+            print("{:<14}{:>9.2f}s{:>12.0f}{:>12.0f}{:>11}{:>10}".format(name, r['time'], r['area'], r['length'], r['crossings'], r['timeouts']))
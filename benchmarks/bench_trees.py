@@ -0,0 +1,152 @@
+"""Time tree generation on a synthetic algorithm, per mode and per stage.
+
+Every tree of each mode is built with ClinicalAlgo.createTree into a
+temporary directory; the 'build' (construction), 'draw' and 'layout' stages
+(plus one entry per output format) are summed per mode and node kind. The
+best of --repeat runs is kept and written to a JSON file together with the
+generator parameters and the current git commit, so results of two commits
+can be compared with --compare. Run from the repository root:
+
+    python -m benchmarks.bench_trees --output before.json
+    python -m benchmarks.bench_trees --output after.json --compare before.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import importlib
+import platform
+import tempfile
+import subprocess
+
+from algo_index import AlgoIndex
+from label_cache import LABELS
+from benchmarks.synthetic import synthetic_algorithm
+
+# Node kinds rendered in each mode, as in the __main__ of generate_trees.py
+MODE_NODES = {
+    'short': ['qs', 'fd', 'md'],
+    'full': ['qs', 'fd'],
+    'mdfocus': ['md', 'cc'],
+}
+
+GENERATOR_PARAMS = ['n_cc', 'mds_per_cc', 'fds_per_md', 'n_questions', 'n_sequences', 'seq_depth', 'answers_per_question', 'parents_per_node', 'seed']
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.decode().strip()
+
+def bench_nodes(module, nodes, index, outdir, mode, backend, builder):
+    # Every run starts from an empty label cache, as a fresh process would
+    LABELS.clear()
+    stages = {}
+    slowest = (0.0, None)
+    start = time.perf_counter()
+    for n in nodes:
+        g = module.ClinicalAlgo(index, horizontal=False, backend=backend, builder=builder)
+        t0 = time.perf_counter()
+        g.createTree(n, outdir, mode)
+        elapsed = time.perf_counter() - t0
+        if elapsed > slowest[0]:
+            slowest = (elapsed, n.getReference())
+        for stage, t in g.getTimings().items():
+            stages[stage] = stages.get(stage, 0.0) + t
+        stages['nodes'] = stages.get('nodes', 0) + len(g.getNodes())
+        stages['edges'] = stages.get('edges', 0) + len(g.getEdges())
+    result = {'trees': len(nodes), 'total': time.perf_counter() - start, 'slowest': slowest[1], 'slowest_time': slowest[0]}
+    result['nodes'] = stages.pop('nodes', 0)
+    result['edges'] = stages.pop('edges', 0)
+    result['stages'] = stages
+    return result
+
+def best_of(runs):
+    # Keep the fastest run, the least disturbed by the rest of the machine
+    return min(runs, key=lambda r: r['total'])
+
+def run(args):
+    params = {p: getattr(args, p) for p in GENERATOR_PARAMS}
+    mds, fds, ccs, qss = synthetic_algorithm(**params)
+    index = AlgoIndex(mds, fds, qss)
+    if args.builder == 'graph':
+        # Built once per run, as plot_nodes does
+        index.getGraph()
+    nodes = {'md': mds, 'fd': fds, 'cc': ccs, 'qs': qss}
+    module = importlib.import_module(args.module)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for mode in args.modes:
+            if args.builder == 'graph' and mode == 'full':
+                # Full trees are only drawn by the walk
+                continue
+            for kind in MODE_NODES[mode]:
+                outdir = os.path.join(tmpdir, mode, kind)
+                os.makedirs(outdir)
+                runs = [bench_nodes(module, nodes[kind], index, outdir, mode, args.backend, args.builder) for _ in range(args.repeat)]
+                results["{}/{}".format(mode, kind)] = best_of(runs)
+
+    return {
+        'commit': git_commit(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'module': args.module,
+        'backend': args.backend,
+        'builder': args.builder,
+        'repeat': args.repeat,
+        'generator': params,
+        'results': results,
+    }
+
+def print_report(report, baseline=None):
+    print("commit {}, {} backend, {} builder, best of {}".format(report['commit'], report['backend'], report.get('builder', 'walk'), report['repeat']))
+    header = "{:<14}{:>6}{:>8}{:>8}".format("mode/nodes", "trees", "nodes", "edges")
+    stages = []
+    for r in report['results'].values():
+        stages += [s for s in r['stages'] if s not in stages]
+    header += "".join("{:>9}".format(s) for s in stages + ['total'])
+    if baseline is not None:
+        header += "{:>11}".format("vs " + str(baseline['commit']))
+    print(header)
+    for key, r in report['results'].items():
+        line = "{:<14}{:>6}{:>8}{:>8}".format(key, r['trees'], r['nodes'], r['edges'])
+        line += "".join("{:>8.2f}s".format(r['stages'].get(s, 0.0)) for s in stages)
+        line += "{:>8.2f}s".format(r['total'])
+        if baseline is not None and key in baseline['results']:
+            line += "{:>10.2f}x".format(r['total'] / baseline['results'][key]['total'])
+        print(line)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', nargs='+', default=list(MODE_NODES), choices=list(MODE_NODES))
+    parser.add_argument('--module', default='generate_trees', choices=['generate_trees', 'generate_trees2'])
+    parser.add_argument('--backend', default='agraph', choices=['agraph', 'stream'])
+    parser.add_argument('--builder', default='walk', choices=['walk', 'graph'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="JSON file receiving the results")
+    parser.add_argument('--compare', help="JSON results of a previous run to compare with")
+    parser.add_argument('--n-cc', dest='n_cc', type=int, default=4)
+    parser.add_argument('--mds-per-cc', dest='mds_per_cc', type=int, default=5)
+    parser.add_argument('--fds-per-md', dest='fds_per_md', type=int, default=4)
+    parser.add_argument('--n-questions', dest='n_questions', type=int, default=300)
+    parser.add_argument('--n-sequences', dest='n_sequences', type=int, default=40)
+    parser.add_argument('--seq-depth', dest='seq_depth', type=int, default=3)
+    parser.add_argument('--answers-per-question', dest='answers_per_question', type=int, default=3)
+    parser.add_argument('--parents-per-node', dest='parents_per_node', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    report = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf8') as f:
+            baseline = json.load(f)
+        if baseline.get('generator') != report['generator']:
+            print("Warning: {} was produced with other generator parameters".format(args.compare), file=sys.stderr)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w', encoding='utf8') as f:
+            json.dump(report, f, indent=1)
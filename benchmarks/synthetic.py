@@ -0,0 +1,168 @@
+"""Synthetic MedAL-C algorithms for benchmarking, without the real JSON.
+
+synthetic_algorithm() returns the same four lists as
+read_epoct_json2.extract_nodes (main diagnoses, final diagnoses, chief
+complaints, question sequences), built from tunable counts and a seed so a
+given configuration always yields the same algorithm.
+
+The epoct constructors expect parsed MedAL-C data, so synthetic nodes are
+bare instances of the epoct classes (the tree builders dispatch on
+type(n) is epoct.X) carrying their own accessors.
+"""
+import random
+
+from libs import epoct
+
+MANAGEMENT_RATE = 0.05
+CATEGORIES = ['symptom', 'exam', 'background_calculation']
+SEVERITIES = ['mild', 'moderate', 'severe', None]
+
+class Value():
+    # Picklable accessor returning a fixed value, so that synthetic nodes can
+    # be sent to the render_batch worker processes
+    def __init__(self, value):
+        self.value = value
+
+    def __call__(self):
+        return self.value
+
+class ChiefComplaint():
+    pass
+
+class Answer():
+    pass
+
+def make_node(cls, node_id, ref, label, **fields):
+    n = cls.__new__(cls)
+    accessors = {
+        'getID': node_id,
+        'getReference': ref,
+        'getLabel': label,
+        'getCategory': 'symptom',
+        'getScore': "",
+        'getSeverity': None,
+        'getGrandParents': [],
+        'getParents': [],
+        'getSeq': [],
+        'getChildren': [],
+        'getMainDiagnosis': None,
+        'getChiefComplaint': None,
+        'getExcludedFinalDiagnoses': [],
+        'getFormulaParent': None,
+        'displaySequenceText': "",
+    }
+    accessors.update(fields)
+    for name, value in accessors.items():
+        setattr(n, name, Value(value))
+    return n
+
+class Generator():
+
+    def __init__(self, seed):
+        self._rnd = random.Random(seed)
+        self._next_id = 0
+
+    def newID(self):
+        self._next_id += 1
+        return self._next_id
+
+    def answers(self, labels):
+        answers = []
+        for lbl in labels:
+            aid = self.newID()
+            answers.append(make_node(Answer, aid, "A{}".format(aid), lbl))
+        return answers
+
+    def question(self, i, answers_per_question):
+        qid = self.newID()
+        category = 'management' if self._rnd.random() < MANAGEMENT_RATE else self._rnd.choice(CATEGORIES)
+        label = "Question {} about symptom / sign (synthetic)".format(i)
+        answers = self.answers(["answer {} = {}".format(i, k) for k in range(answers_per_question)])
+        return make_node(epoct.Question, qid, "Q{}".format(qid), label, getCategory=category, getScore=str(self._rnd.randint(0, 3)), getChildren=answers)
+
+    def sequence(self, i, members):
+        sid = self.newID()
+        label = "Sequence {} (synthetic)".format(i)
+        answers = self.answers(["yes", "no"])
+        return make_node(epoct.QuestionSequence, sid, "QS{}".format(sid), label, getCategory='predefined_syndrome', getSeq=members, getChildren=answers, displaySequenceText="sequence {}".format(i))
+
+    def link(self, n, candidates, k):
+        # Make n depend on one answer of each of k nodes taken from candidates
+        for p in self._rnd.sample(candidates, min(k, len(candidates))):
+            n.getGrandParents().append(p)
+            n.getParents().append(self._rnd.choice(p.getChildren()))
+
+    def sample(self, candidates, k):
+        return self._rnd.sample(candidates, min(k, len(candidates)))
+
+    def random(self):
+        return self._rnd.random()
+
+    def choice(self, candidates):
+        return self._rnd.choice(candidates)
+
+def synthetic_algorithm(n_cc=4, mds_per_cc=5, fds_per_md=4, n_questions=300, n_sequences=40, seq_depth=3, answers_per_question=3, parents_per_node=2, seed=0):
+    """Build a synthetic algorithm.
+
+    n_cc chief complaints each own mds_per_cc main diagnoses, which each own
+    fds_per_md final diagnoses. Up to n_sequences question sequences are
+    spread over seq_depth nesting levels, a sequence of level k > 0 nesting
+    one sequence of level k - 1.
+    Returns (main diagnoses, final diagnoses, chief complaints, question sequences).
+    """
+    gen = Generator(seed)
+
+    # Questions and sequences are created in one stream and only depend on, or
+    # contain, nodes created before them, so the algorithm is acyclic
+    questions = []
+    levels = [[] for _ in range(max(1, seq_depth))]
+    question_seqs = []
+    seq_every = max(1, n_questions // max(1, n_sequences))
+    for i in range(n_questions):
+        q = gen.question(i, answers_per_question)
+        if questions and gen.random() < 0.5:
+            gen.link(q, questions, parents_per_node)
+        # Some questions are only asked when a sequence holds
+        if question_seqs and gen.random() < 0.1:
+            gen.link(q, question_seqs, 1)
+        questions.append(q)
+
+        if (i + 1) % seq_every == 0 and len(question_seqs) < n_sequences:
+            # A sequence of level k > 0 nests one sequence of level k - 1
+            level = len(question_seqs) % len(levels)
+            members = gen.sample(questions, 4)
+            if level > 0 and levels[level - 1]:
+                members.append(gen.choice(levels[level - 1]))
+            s = gen.sequence(len(question_seqs), members)
+            gen.link(s, questions, parents_per_node)
+            levels[level].append(s)
+            question_seqs.append(s)
+
+    cc_nodes = []
+    main_diagnoses = []
+    final_diagnoses = []
+    for i in range(n_cc):
+        cid = gen.newID()
+        cc = make_node(ChiefComplaint, cid, "CC{}".format(cid), "Chief complaint {}".format(i))
+        cc_nodes.append(cc)
+        for j in range(mds_per_cc):
+            mid = gen.newID()
+            members = gen.sample(questions, 4) + gen.sample(question_seqs, 1)
+            md = make_node(epoct.DiagnosisSequence, mid, "DS{}".format(mid), "Diagnosis {}.{} / synthetic".format(i, j), getSeq=members, getChiefComplaint=cc)
+            gen.link(md, questions, parents_per_node)
+            main_diagnoses.append(md)
+            fds = []
+            for k in range(fds_per_md):
+                fid = gen.newID()
+                fd = make_node(epoct.FinalDiagnosis, fid, "DF{}".format(fid), "Final diagnosis {}.{}.{}".format(i, j, k), getSeverity=gen.choice(SEVERITIES), getMainDiagnosis=md)
+                gen.link(fd, questions, parents_per_node + 1)
+                if question_seqs and gen.random() < 0.5:
+                    gen.link(fd, question_seqs, 1)
+                fds.append(fd)
+            # Final diagnoses of a main diagnosis exclude each other now and then
+            for fd in fds:
+                if len(fds) > 1 and gen.random() < 0.3:
+                    fd.getExcludedFinalDiagnoses().append(gen.choice([f for f in fds if f is not fd]))
+            final_diagnoses.extend(fds)
+
+    return main_diagnoses, final_diagnoses, cc_nodes, question_seqs
@@ -0,0 +1,88 @@
+import os
+import tempfile
+import subprocess
+
+###################
+# Streaming DOT writer
+###################
+
+# Registered export formats that Graphviz writes directly with -T<format>
+STREAM_FORMATS = ['png', 'svg', 'pdf', 'dot']
+
+def quote(value):
+    value = str(value)
+    # HTML-like labels are already delimited by their outer <>
+    if value.startswith('<') and value.endswith('>'):
+        return value
+    return '"' + value.replace('"', '\\"') + '"'
+
+def format_attrs(attrs):
+    return ", ".join("{}={}".format(k, quote(v)) for k, v in attrs.items())
+
+def write_dot(f, graph_attrs, nodes, edges, strict=False, directed=False):
+    """Write a graph as DOT text to the text stream f.
+
+    nodes yields (id, attrs) pairs and edges (id1, id2, attrs) triples, so
+    the caller can generate them lazily; nothing is kept in memory besides
+    the line being written. Graphs are undirected by default, like AGraph.
+    """
+    f.write("{}{} {{\n".format("strict " if strict else "", "digraph" if directed else "graph"))
+    edgeop = "->" if directed else "--"
+    if graph_attrs:
+        f.write("graph [{}];\n".format(format_attrs(graph_attrs)))
+    for nid, attrs in nodes:
+        f.write("{} [{}];\n".format(quote(nid), format_attrs(attrs)))
+    for id1, id2, attrs in edges:
+        f.write("{} {} {} [{}];\n".format(quote(id1), edgeop, quote(id2), format_attrs(attrs)))
+    f.write("}\n")
+
+def override_graph_attrs(dotfile, graph_attrs, outfile):
+    """Copy dotfile to outfile, with graph_attrs set after its own graph attributes.
+
+    Graphviz takes -G command-line values as defaults, which the attributes
+    written in the file override. A graph statement inserted before the
+    closing brace of the graph comes after them, so its values win. The
+    file is copied in chunks.
+    """
+    with open(dotfile, 'rb') as src:
+        size = src.seek(0, os.SEEK_END)
+        tail = max(0, size - 4096)
+        src.seek(tail)
+        end = tail + src.read().rindex(b'}')
+        src.seek(0)
+        with open(outfile, 'wb') as dst:
+            remaining = end
+            while remaining:
+                chunk = src.read(min(remaining, 1 << 20))
+                dst.write(chunk)
+                remaining -= len(chunk)
+            dst.write("graph [{}];\n}}\n".format(format_attrs(graph_attrs)).encode('utf8'))
+
+def run_layout(dotfile, outputs, prog='dot', timeout=None, graph_attrs=None):
+    # A single Graphviz run lays the graph out once and writes every output;
+    # graph_attrs override the graph attributes of the file, in a copy of it.
+    # On timeout, subprocess kills Graphviz and raises TimeoutExpired.
+    if graph_attrs:
+        fd, attempt = tempfile.mkstemp(suffix='.dot', dir=os.path.dirname(os.path.abspath(dotfile)))
+        os.close(fd)
+        try:
+            override_graph_attrs(dotfile, graph_attrs, attempt)
+            return run_layout(attempt, outputs, prog, timeout)
+        finally:
+            os.remove(attempt)
+    cmd = [prog]
+    for fmt, outfile in outputs.items():
+        if fmt not in STREAM_FORMATS:
+            raise ValueError("Format '{}' needs the agraph backend (streamed: {})".format(fmt, ", ".join(STREAM_FORMATS)))
+        cmd += ["-T{}".format(fmt), "-o", outfile]
+    cmd.append(dotfile)
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+    if result.returncode != 0:
+        raise RuntimeError("{} failed on {}: {}".format(prog, dotfile, result.stderr.decode('utf8', 'replace').strip()))
+
+def pipe_layout(dotfile, fmt, prog='dot', timeout=None):
+    # Lay out and return the output as bytes, read from Graphviz's stdout
+    result = subprocess.run([prog, "-T{}".format(fmt), dotfile], stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+    if result.returncode != 0:
+        raise RuntimeError("{} failed on {}: {}".format(prog, dotfile, result.stderr.decode('utf8', 'replace').strip()))
+    return result.stdout
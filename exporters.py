@@ -0,0 +1,86 @@
+import os
+import json
+import time
+
+###################
+# Exporter registry
+###################
+
+# Format -> (file extension, exporter). An exporter is called as
+# exporter(graph, outfile) on an AGraph that has already been laid out.
+EXPORTERS = {}
+
+def register_exporter(fmt, extension, exporter):
+    EXPORTERS[fmt] = (extension, exporter)
+
+def graphviz_exporter(fmt):
+    # Formats rendered by Graphviz itself; draw() without prog reuses the layout
+    def export(graph, outfile):
+        graph.draw(outfile, format=fmt)
+    return export
+
+def write_dot(graph, outfile):
+    # DOT source annotated with the computed positions
+    graph.write(outfile)
+
+def write_positions(graph, outfile):
+    # Plain JSON dump of the layout attributes computed by Graphviz
+    layout = {}
+    layout['bb'] = graph.graph_attr.get('bb')
+    layout['nodes'] = {}
+    for n in graph.nodes():
+        layout['nodes'][str(n)] = {'pos': n.attr.get('pos'), 'width': n.attr.get('width'), 'height': n.attr.get('height')}
+    layout['edges'] = []
+    for e in graph.edges():
+        layout['edges'].append({'tail': str(e[0]), 'head': str(e[1]), 'key': e.name, 'pos': e.attr.get('pos')})
+    with open(outfile, 'w', encoding='utf8') as f:
+        json.dump(layout, f, indent=1)
+
+def write_drawio(graph, outfile):
+    # graphviz2drawio is only needed for this format. Note that it runs its
+    # own dot layout to get the SVG it converts.
+    from graphviz2drawio import graphviz2drawio
+    xml = graphviz2drawio.convert(graph)
+    with open(outfile, 'w', encoding="utf8") as f:
+        f.write(xml)
+
+for fmt in ['png', 'svg', 'pdf']:
+    register_exporter(fmt, fmt, graphviz_exporter(fmt))
+register_exporter('dot', 'dot', write_dot)
+register_exporter('json', 'json', write_positions)
+register_exporter('drawio', 'xml', write_drawio)
+
+def check_formats(formats):
+    for fmt in formats:
+        if fmt not in EXPORTERS:
+            raise ValueError("Unknown export format '{}' (registered: {})".format(fmt, ", ".join(EXPORTERS)))
+
+def output_files(outfile, formats):
+    # One file per format, named after outfile with the format's extension
+    check_formats(formats)
+    root = os.path.splitext(outfile)[0]
+    return {fmt: "{}.{}".format(root, EXPORTERS[fmt][0]) for fmt in formats}
+
+###################
+# Layout rendering
+###################
+
+def render_layout(graph, outputs, prog='dot'):
+    """Lay out an AGraph once and write it with every requested exporter.
+
+    outputs maps a registered format ('png', 'svg', 'pdf', 'dot', 'json',
+    'drawio', ...) to its output file. pygraphviz reuses the computed layout
+    when draw() is called without prog, so Graphviz runs the layout engine a
+    single time whatever the number of formats.
+    Returns the seconds spent per stage: 'layout', then one entry per format.
+    """
+    check_formats(outputs)
+    timings = {}
+    start = time.perf_counter()
+    graph.layout(prog=prog)
+    timings['layout'] = time.perf_counter() - start
+    for fmt, outfile in outputs.items():
+        start = time.perf_counter()
+        EXPORTERS[fmt][1](graph, outfile)
+        timings[fmt] = time.perf_counter() - start
+    return timings
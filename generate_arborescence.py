@@ -2,58 +2,147 @@ import os
 from datetime import date, datetime
 from read_epoct_json2 import extract_nodes
 from epoct import Diagnosis, FinalDiagnosis, Question, QuestionSequence, Answer
-from shutil import copyfile, rmtree
+from shutil import copyfile
+from concurrent.futures import ThreadPoolExecutor
+from artifact_store import ArtifactStore
+from packager import Packager
+from json_stream import load_sections, ALGORITHM_KEYS, NODE_SECTIONS
+from render_cache import cache_dir_for
 
-def generate_arborescence(main_diagnosis_nodes, final_diagnosis_nodes, cc_nodes, data, keys, outdir):
+def format_label(lbl):
 
-    def format_label(lbl):
+    lbl = lbl.replace("/", "-").replace(",", "").replace(" ", "_")
+    idx = lbl.rfind("(")
+    if idx>-1:
+        lbl = lbl[:idx]
+    if lbl[-1] == "_":
+        lbl = lbl[:-1]
+    return lbl
 
-        lbl = lbl.replace("/", "-").replace(",", "").replace(" ", "_")
-        idx = lbl.rfind("(")
-        if idx>-1:
-            lbl = lbl[:idx]
-        if lbl[-1] == "_":
-            lbl = lbl[:-1]
-        return lbl
+def plan_export(main_diagnosis_nodes, final_diagnosis_nodes, cc_nodes, outdir, export_dir):
+    # (node, image, exported file) triples of the CC / MD / FD hierarchy; main and
+    # final diagnoses are grouped by chief complaint and main diagnosis in one pass
+    mds_of = {}
+    for md in main_diagnosis_nodes:
+        if md.getChiefComplaint() is not None:
+            mds_of.setdefault(md.getChiefComplaint().getID(), []).append(md)
+    fds_of = {}
+    for fd in final_diagnosis_nodes:
+        if fd.getMainDiagnosis() is not None:
+            fds_of.setdefault(fd.getMainDiagnosis().getID(), []).append(fd)
+
+    plan = []
+    for cc in cc_nodes:
+
+        current_dir = os.path.join(export_dir, "{0:03d}_{1}".format(cc.getID(), format_label(cc.getLabel())))
+        print(current_dir)
+
+        for md in mds_of.get(cc.getID(), []):
+
+            print("\t {}".format(md.getLabel()))
+            current_subdir = os.path.join(current_dir, "{0:03d}_{1}".format(md.getID(), format_label(md.getLabel())))
+
+            imgname = "D{0:03d}_{1}.png".format(md.getID(), format_label(md.getLabel()))
+            imgfile = os.path.join(outdir, "main_diagnoses", "node{0:03d}-full.png".format(md.getID()))
+            plan.append((md, imgfile, os.path.join(current_subdir, imgname)))
+
+            for fd in fds_of.get(md.getID(), []):
+
+                imgname = "FD{0:03d}_{1}.png".format(fd.getID(), format_label(fd.getLabel()))
+                imgfile = os.path.join(outdir, "final_diagnoses", "node{0:03d}-full.png".format(fd.getID()))
+                plan.append((fd, imgfile, os.path.join(current_subdir, imgname)))
+    return plan
+
+def copy_if_changed(src, dest):
+    # Copy unless dest is as large as src and not older
+    if os.path.exists(dest) and os.path.getsize(dest) == os.path.getsize(src) and os.path.getmtime(dest) >= os.path.getmtime(src):
+        return 'unchanged'
+    copyfile(src, dest)
+    return 'copy'
+
+def sync_export(plan, export_dir, export_file, workers=None, keep=("info.txt",)):
+    """Bring export_dir in line with plan, a list of (node, image, exported file).
+
+    Only the files that changed are written, by export_file(src, dest) on a
+    thread pool; it returns 'unchanged' or how it wrote dest. Files and
+    directories of export_dir outside the plan are removed, except keep.
+    Returns the number of files per outcome, 'removed' included.
+    """
+    for d in {os.path.dirname(dest) for _, _, dest in plan}:
+        os.makedirs(d, exist_ok=True)
+    counts = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for outcome in pool.map(lambda job: export_file(job[1], job[2]), plan):
+            counts[outcome] = counts.get(outcome, 0) + 1
+
+    planned = {os.path.normpath(dest) for _, _, dest in plan}
+    planned.update(os.path.normpath(os.path.join(export_dir, k)) for k in keep)
+    for root, dirs, files in os.walk(export_dir, topdown=False):
+        for f in files:
+            path = os.path.normpath(os.path.join(root, f))
+            if path not in planned:
+                os.remove(path)
+                counts['removed'] = counts.get('removed', 0) + 1
+        if root != export_dir and not os.listdir(root):
+            os.rmdir(root)
+    return counts
+
+def tree_renderer(index, mode="full", fmt='png'):
+    # render(node) for package_export: the image of the tree of a node of index
+    # (extracted by generate_trees, whose trees dispatch on the libs epoct types)
+    from generate_trees import render_image
+    def render(n):
+        return render_image(n, index, mode, fmt)
+    return render
+
+def package_export(plan, info, export_dir, archive, render=None):
+    """Write info.txt and the images of plan into archive (a Packager).
+
+    Entries are named after their path relative to the parent of export_dir,
+    so that the archive unpacks into the dated export folder. render(node)
+    (see tree_renderer) returns the image of a node as bytes, rendered
+    straight into the archive without any intermediate file. Without it,
+    images rendered earlier are streamed from their files.
+    """
+    root = os.path.dirname(export_dir)
+    archive.addBytes(os.path.relpath(os.path.join(export_dir, "info.txt"), root), info.encode('utf8'))
+    for n, imgfile, dest in plan:
+        arcname = os.path.relpath(dest, root)
+        if render is not None:
+            archive.addBytes(arcname, render(n))
+        else:
+            archive.addFile(arcname, imgfile)
+    return archive.getCount()
+
+def generate_arborescence(main_diagnosis_nodes, final_diagnosis_nodes, cc_nodes, data, keys, outdir, store=None, workers=None, archive=None, render=None):
+
+    # With an ArtifactStore, the exported images are links to its objects
+    # instead of copies
+    export_file = store.export if store is not None else copy_if_changed
 
     export_dir = os.path.join(outdir, "export_{}".format(datetime.strftime(date.today(),'%d%b%y')))
-    os.makedirs(export_dir, exist_ok=True)
+    info = "".join("{}: {}\n".format(k, data[k]) for k in keys)
 
-    for d in os.listdir(export_dir):
-        rmtree(os.path.join(export_dir, d), ignore_errors=True)
-    with open(os.path.join(export_dir, "info.txt"), "w") as f:
-        for k in keys:
-            text = "{}: {}\n".format(k, data[k])
-            f.write(text)
+    # With archive (a Packager), the hierarchy is written into the archive
+    # instead of the export folder, with the trees drawn straight into it by
+    # render (see tree_renderer)
+    if archive is not None:
+        plan = plan_export(main_diagnosis_nodes, final_diagnosis_nodes, cc_nodes, outdir, export_dir)
+        return {'archived': package_export(plan, info, export_dir, archive, render)}
 
-    cc_names = {} 
-    for cc in cc_nodes:
+    os.makedirs(export_dir, exist_ok=True)
+    with open(os.path.join(export_dir, "info.txt"), "w") as f:
+        f.write(info)
 
-        #Create directory
-        cc_names[cc.getID()] = "{0:03d}_{1}".format(cc.getID(), format_label(cc.getLabel()))
-        current_dir = os.path.join(export_dir, cc_names[cc.getID()])
-        print(current_dir)
-        
-        md_names = {}
-        for md in main_diagnosis_nodes:
-            if md.getChiefComplaint() == cc:
-
-                print("\t {}".format(md.getLabel()))
-                #Create directory
-                md_names[md.getID()] = "{0:03d}_{1}".format(md.getID(), format_label(md.getLabel()))
-                current_subdir = os.path.join(current_dir, md_names[md.getID()])
-                os.makedirs(current_subdir, exist_ok=True)
-                
-                imgname = "D{0:03d}_{1}.png".format(md.getID(), format_label(md.getLabel()))
-                imgfile = os.path.join(outdir, "main_diagnoses", "node{0:03d}-full.png".format(md.getID()))
-                copyfile(imgfile, os.path.join(current_subdir, imgname))
-
-                for fd in final_diagnosis_nodes:
-                    if fd.getMainDiagnosis() == md:
-                        
-                        imgname = "FD{0:03d}_{1}.png".format(fd.getID(), format_label(fd.getLabel()))
-                        imgfile = os.path.join(outdir, "final_diagnoses", "node{0:03d}-full.png".format(fd.getID()))
-                        copyfile(imgfile, os.path.join(current_subdir, imgname))
+    # Only the images that changed since the last export of the day are written,
+    # by workers threads (None: the default of ThreadPoolExecutor)
+    plan = plan_export(main_diagnosis_nodes, final_diagnosis_nodes, cc_nodes, outdir, export_dir)
+    counts = sync_export(plan, export_dir, export_file, workers)
+    if store is not None:
+        # The objects no export links to, like those of re-rendered trees
+        counts['pruned'] = store.prune()
+    print(", ".join("{} {}".format(n, outcome) for outcome, n in sorted(counts.items())))
+    return counts
 
 if __name__ == '__main__':
 
@@ -63,17 +152,44 @@ if __name__ == '__main__':
     json_path = r'C:\Users\langhe\switchdrive\Private\Unisanté\medal_c_18.06.20.json'
     outdir = r'C:\Users\langhe\switchdrive\Private\Unisanté\epoct_variables'
     
+    # Stream only the metadata and the node sections of the json file instead
+    # of loading it whole (needs ijson to save memory, and an extract_nodes
+    # reading no other section than json_stream.NODE_SECTIONS)
+    streaming = False
+
     # Load data from json file
-    with open(json_path, encoding='utf8') as f:
-        data = json.load(f)
+    keys = ALGORITHM_KEYS
+    if streaming:
+        data = load_sections(json_path, keys + NODE_SECTIONS)
+    else:
+        with open(json_path, encoding='utf8') as f:
+            data = json.load(f)
 
     # Print clinical algorithm generic information
-    keys = ['id', 'algorithm_id', 'name', 'version', 'version_id', 'author', 'created_at', 'updated_at']
     for k in keys:
         print("{}: {}".format(k, data[k]))
 
-    # Extract node structure
-    main_diagnosis_nodes, final_diagnosis_nodes, cc_nodes, question_seq_nodes = extract_nodes(data)
+    # Stream the export into an archive for the reviewers instead of writing the
+    # export folder (None: export folder)
+    archive_file = None
+    #archive_file = os.path.join(outdir, "export_{}.zip".format(datetime.strftime(date.today(),'%d%b%y')))
+
+    if archive_file is None:
+        # Extract node structure
+        main_diagnosis_nodes, final_diagnosis_nodes, cc_nodes, question_seq_nodes = extract_nodes(data)
+
+        # Images exported as links into the artifact store of the rendered trees
+        store = ArtifactStore(os.path.join(cache_dir_for(outdir), "artifacts"))
 
-    # Create Word export
-    generate_arborescence(main_diagnosis_nodes, final_diagnosis_nodes, cc_nodes, data, keys, outdir)
\ No newline at end of file
+        # Create Word export
+        generate_arborescence(main_diagnosis_nodes, final_diagnosis_nodes, cc_nodes, data, keys, outdir, store)
+    else:
+        # The trees are rendered straight into the archive by generate_trees:
+        # the node structure is extracted once from data by generate_trees, for
+        # both the hierarchy of the archive and the trees drawn
+        import generate_trees
+        from algo_index import AlgoIndex
+        ctg_code, severity_df, main_diagnosis_nodes, final_diagnosis_nodes, cc_nodes, question_seq_nodes = generate_trees.load_algorithm(data=data)
+        render = tree_renderer(AlgoIndex(main_diagnosis_nodes, final_diagnosis_nodes, question_seq_nodes), "full")
+        with Packager(archive_file) as archive:
+            generate_arborescence(main_diagnosis_nodes, final_diagnosis_nodes, cc_nodes, data, keys, outdir, archive=archive, render=render)
@@ -1,10 +1,30 @@
 import os
+import time
+import tempfile
+import tracemalloc
+from functools import partial
 from pygraphviz import *
 from copy import deepcopy
 from libs import read_epoct_json2
 from definitions import JSON_PATH, OUTPUT_DIR, CLINICAL_KEYS_PATH
 from utils import loadCategoryCoding, loadDiagnosisSeverity2, loadTests
+import utils
 from libs import algoreader, epoct
+from algo_index import AlgoIndex
+from batch import render_batch
+from exporters import render_layout, output_files
+from dot_writer import write_dot, run_layout, pipe_layout
+from render_cache import RenderCache, cache_dir_for
+from artifact_store import ArtifactStore
+from profiling import RunProfile, profile_stage, start_stage, end_stage, max_rss
+from snapshot import load_snapshot
+from graph_model import NodeRecord, EdgeRecord, struct_name, port_name
+from layout_scheduler import LayoutScheduler, report_layouts
+from layout_strategy import select_layout
+from json_stream import load_sections
+from algo_diff import AlgoDiff
+from label_cache import LABELS
+from watch import watch_algorithm, read_baseline, node_sections
 
 lightgray = "#D3D3D3"
 gray = "#808080"
@@ -13,6 +33,8 @@ cqs = "#40e0d0"
 cqsa = "#c9fffa"
 cfd = "#FF5733"
 cmd = "#FFC300"
+# Questions and answers of diff-highlighted trees
+diff_colors = {'added': "#b3ffb3", 'changed': "#ffd27f", 'removed': "#ff9999"}
 
 def wrap_text(s, max_len):
 
@@ -50,12 +72,12 @@ conv[">"] = "&#62;"
 conv["°"] = "&#176;"
 conv["="] = "&#61;"
 conv["/"] = "&#47;"
+# Single pass escaping of the conv characters
+escapes = str.maketrans(conv)
 
 def format_reflbl(n):
     max_len = 20
-    lbl = n.getLabel()
-    for k, s in zip(conv.keys(), conv.values()):
-        lbl = lbl.replace(k, s)
+    lbl = n.getLabel().translate(escapes)
     idx = lbl.find('(')
     if idx>-1:
         lbl = lbl[:idx]
@@ -66,9 +88,7 @@ def format_reflbl(n):
 
 def format_albl(n):
     max_len = 20
-    lbl = n.getLabel()
-    for k, s in zip(conv.keys(), conv.values()):
-        lbl = lbl.replace(k, s)
+    lbl = n.getLabel().translate(escapes)
     idx = lbl.find('(')
     if idx>-1:
         lbl = lbl[:idx]
@@ -76,6 +96,10 @@ def format_albl(n):
     lbl = wrap_text(lbl, max_len)
     return lbl
 
+def reference_label(n):
+    # format_reflbl(n), computed once per node for the process
+    return LABELS.get(('reflbl', type(n), n.getID()), format_reflbl, n)
+
 def html_format(qlbl, qbgc, albls, indices, bgcolors):
 
     nb_answers = len(albls)
@@ -100,204 +124,371 @@ def html_format_vert(qlbl, qbgc, albls, indices, bgcolors):
 
 class ClinicalAlgo():
 
-    def __init__(self, horizontal=True):
-        self._graph = AGraph(strict=False)
+    def __init__(self, index, horizontal=True, backend='agraph', builder='walk', layout=None, diff=None):
+        # backend 'agraph' draws into a pygraphviz AGraph, 'stream' writes the
+        # DOT text to a file and lays it out with a single Graphviz run
+        self._backend = backend
+        # builder 'walk' follows the epoct links from the root, 'graph' extracts
+        # the tree from the dependency graph of the whole algorithm (AlgoGraph);
+        # full trees are only drawn by the walk (AlgoGraph.view raises ValueError)
+        self._builder = builder
+        # layout None always uses dot with spline routing, a dict has the engine
+        # and routing picked from the size of the tree (see layout_strategy),
+        # its entries overriding that choice
+        self._layout = layout
+        self._prog = 'dot'
+        # With diff (an AlgoDiff), the questions and answers changed since the
+        # previous version of the algorithm are coloured, in -diff files
+        self._diff = diff
+        self._graph = AGraph(strict=False) if backend == 'agraph' else None
+        self._dotfile = None
+        self._dottemp = None
+        self._index = index
         self._horizontal = horizontal
+        self._graph_attr = {}
         if self._horizontal:
-            self._graph.graph_attr['rankdir'] = 'LR'
-        self._graph.graph_attr['splines'] = 'spline'
-        self._root    = {}
-        self._nodes   = []
-        self._edges   = []
-        self._answers = []
+            self._graph_attr['rankdir'] = 'LR'
+        self._graph_attr['splines'] = 'spline'
+        if self._graph is not None:
+            self._graph.graph_attr.update(self._graph_attr)
+        self._root    = NodeRecord()
+        # Nodes, edges and answers are keyed by their ID / key so that the same
+        # question or link reached through several paths is drawn only once
+        self._nodes   = {}
+        self._edges   = {}
+        self._answers = {}
+        # Question nodes in the order they were (re)added, duplicates included:
+        # the work list walked by addFullSequence and addFullDiagnosis
+        self._added   = []
+        # HTML labels of the question nodes, built by buildLabels
+        self._labels  = None
+        # Seconds spent per stage (build, labels, draw, layout and one entry per
+        # output format) and, when tracemalloc is tracing, peak bytes per stage
+        self._timings = {}
+        self._memory  = {}
+        # Labels cached for the algorithm of index; counters when the tree was
+        # started, for its own hits and misses
+        LABELS.use(index)
+        self._label_stats = (LABELS.hits, LABELS.misses)
     
     def setRoot(self, r):
-        self._root['node'] = r
-        self._root['id'] = r.getID()
-        self._root['label'] = format_reflbl(r)
-        self._root['shape'] = 'doubleoctagon'
+        self._root.node = r
+        self._root.id = r.getID()
+        self._root.label = reference_label(r)
+        self._root.shape = 'doubleoctagon'
         if type(r) is epoct.FinalDiagnosis:
             if r.getSeverity() == "mild":
-                self._root['color'] = '#ccffcc'
+                self._root.color = '#ccffcc'
             elif r.getSeverity() == "moderate":
-                self._root['color'] = '#ffff99'
+                self._root.color = '#ffff99'
             elif r.getSeverity() == "severe":
-                self._root['color'] = '#ff8080'
+                self._root.color = '#ff8080'
             else:
-                self._root['color'] = lightgray
+                self._root.color = lightgray
         elif type(r) is epoct.DiagnosisSequence:
-            self._root['color'] = cmd
+            self._root.color = cmd
         elif type(r) is epoct.QuestionSequence:
-            self._root['color'] = cqs
+            self._root.color = cqs
         else:
-            self._root['color'] = lightgray
+            self._root.color = lightgray
 
     def getRoot(self):
         return self._root
 
     def getNodes(self):
-        return self._nodes
+        return list(self._nodes.values())
 
     def addNode(self, n):
-        for n in self._nodes:
-            self._nodes.append(n)
+        # The first node added with a given ID is kept
+        if n.id not in self._nodes:
+            self._nodes[n.id] = n
 
     def getEdges(self):
-        return self._edges
+        return list(self._edges.values())
 
-    def addEdge(self, e):
-        if e not in self._edges:
-            self._edges.append(e)
+    def storeEdge(self, e):
+        # An edge with the key of a stored one replaces its attributes but keeps
+        # its position, as Graphviz does when the same keyed edge is added twice
+        self._edges[e.key] = e
 
     def addAnswer(self, a):
-        self._answers.append(a)
+        self._answers[a.getID()] = a
 
     def getAnswers(self):
-        return self._answers
-
-    def draw(self):
-        if type(self._root['node']) is not epoct.DiagnosisSequence:
-            self._graph.add_node(self._root['id'], label=self._root['label'], shape=self._root['shape'], fillcolor=self._root['color'], style="filled")
-        for n in self._nodes:
-            if type(n['node']) is epoct.Question or type(n['node']) is epoct.QuestionSequence:
-                self._graph.add_node(n['id'], label=n['html_label'], shape=n['shape'])
-            else:
-                self._graph.add_node(n['id'], label=n['label'], shape=n['shape'], fillcolor=n['color'], style="filled")
-        for e in self._edges:
-            if 'headport' in e.keys():
-                if 'tailport' in e.keys():
-                    self._graph.add_edge(e['id1'], e['id2'], tailport=e['tailport'], headport=e['headport'], key=e['key'], color=e['color'], label=e['label'], style=e["style"])
-                else:
-                    self._graph.add_edge(e['id1'], e['id2'], headport=e['headport'], key=e['key'], color=e['color'], label=e['label'], style=e["style"])
+        return list(self._answers.values())
+
+    def buildLabels(self):
+        # Build the HTML labels of the question nodes, highlighting the recorded answers
+        self._labels = {}
+        for n in self._nodes.values():
+            if type(n.node) is epoct.Question or type(n.node) is epoct.QuestionSequence:
+                self._labels[n.id] = self.htmlLabel(n)
+
+    def drawNodes(self):
+        # (id, attributes) of the nodes to draw, root first
+        if self._labels is None:
+            self.buildLabels()
+        # Merged trees have no root, their final diagnoses being simple nodes
+        if self._root.node is not None and type(self._root.node) is not epoct.DiagnosisSequence:
+            yield self._root.id, {'label': self._root.label, 'shape': self._root.shape, 'fillcolor': self._root.color, 'style': "filled"}
+        for n in self._nodes.values():
+            if type(n.node) is epoct.Question or type(n.node) is epoct.QuestionSequence:
+                yield n.id, {'label': self._labels[n.id], 'shape': n.shape}
             else:
-                if 'tailport' in e.keys():
-                    self._graph.add_edge(e['id1'], e['id2'], tailport=e['tailport'], key=e['key'], color=e['color'], label=e['label'], style=e["style"])
-                else:
-                    self._graph.add_edge(e['id1'], e['id2'], key=e['key'], color=e['color'], label=e['label'], style=e["style"])
-        
+                yield n.id, {'label': n.label, 'shape': n.shape, 'fillcolor': n.color, 'style': "filled"}
+
+    def drawEdges(self):
+        # (tail id, head id, attributes) of the edges to draw
+        for e in self._edges.values():
+            attrs = {}
+            if e.tailport is not None:
+                attrs['tailport'] = e.tailport
+            if e.headport is not None:
+                attrs['headport'] = e.headport
+            attrs['key'] = e.key
+            attrs['color'] = e.color
+            attrs['label'] = e.label
+            attrs['style'] = e.style
+            yield e.id1, e.id2, attrs
+
+    def writeDot(self, f):
+        # Stream the graph as DOT text to f (a file, a pipe...), bypassing pygraphviz
+        write_dot(f, self._graph_attr, self.drawNodes(), self.drawEdges())
+
+    def chooseLayout(self):
+        if self._layout is None:
+            return
+        edges = self._edges.values()
+        ports = any(e.tailport or e.headport for e in edges)
+        labels = any(e.label is not None and str(e.label) != "" for e in edges)
+        self._prog, attrs = select_layout(len(self._nodes) + 1, len(self._edges), ports, labels, self._layout)
+        self._graph_attr.update(attrs)
+        if self._graph is not None:
+            self._graph.graph_attr.update(attrs)
+
+    def getLayout(self):
+        # Engine and graph attributes the tree is laid out with
+        return self._prog, dict(self._graph_attr)
+
+    def draw(self, dotfile=None):
+        self.chooseLayout()
+        if self._backend == 'stream':
+            # Without dotfile, the DOT text goes to a temporary file removed after export
+            if dotfile is None:
+                fd, dotfile = tempfile.mkstemp(suffix='.dot')
+                os.close(fd)
+                self._dottemp = dotfile
+            with open(dotfile, 'w', encoding='utf8') as f:
+                self.writeDot(f)
+            self._dotfile = dotfile
+            return
+        for nid, attrs in self.drawNodes():
+            self._graph.add_node(nid, **attrs)
+        for id1, id2, attrs in self.drawEdges():
+            self._graph.add_edge(id1, id2, **attrs)
+
+    def source(self):
+        # DOT text of the drawn graph, as compared by the render cache
+        if self._backend == 'stream':
+            with open(self._dotfile, encoding='utf8') as f:
+                return f.read()
+        return self._graph.string()
+
+    def render(self, outputs, prog=None):
+        # Lay out once and write every format of outputs ({format: file}) from that
+        # layout; formats are those of the exporters.EXPORTERS registry
+        prog = prog or self._prog
+        if self._backend == 'stream':
+            # The Graphviz run both lays out and writes the outputs
+            start = time.perf_counter()
+            run_layout(self._dotfile, outputs, prog)
+            timings = {'layout': time.perf_counter() - start}
+        else:
+            timings = render_layout(self._graph, outputs, prog)
+        self._timings.update(timings)
+        return timings
+
+    def pipe(self, fmt='png', prog=None):
+        # Lay out and return the output as bytes, without writing any file
+        prog = prog or self._prog
+        try:
+            if self._backend == 'stream':
+                return pipe_layout(self._dotfile, fmt, prog)
+            return self._graph.draw(format=fmt, prog=prog)
+        finally:
+            if self._dottemp is not None:
+                os.remove(self._dottemp)
+                self._dottemp = None
+
     def export2png(self, pngfile):
-        self._graph.layout(prog='dot')
-        self._graph.draw(pngfile, prog='dot')
+        self.export({'png': pngfile})
+
+    def getTimings(self):
+        return self._timings
+
+    def getProfile(self):
+        profile = {}
+        profile['timings'] = self._timings
+        profile['memory']  = self._memory
+        profile['nodes']   = len(self._nodes)
+        profile['edges']   = len(self._edges)
+        profile['max_rss'] = max_rss()
+        profile['label_hits']   = LABELS.hits - self._label_stats[0]
+        profile['label_misses'] = LABELS.misses - self._label_stats[1]
+        return profile
 
     def addSimpleNode(self, n):
-        cnode = {}
-        cnode['node']  = n
-        cnode['id']  = n.getID()
-        cnode['label'] = format_reflbl(n)
+        cnode = NodeRecord()
+        cnode.node  = n
+        cnode.id  = n.getID()
+        cnode.label = reference_label(n)
         if type(n) is epoct.FinalDiagnosis:
-            cnode['shape'] = 'doubleoctagon'
+            cnode.shape = 'doubleoctagon'
             if n.getSeverity() == "mild":
-                cnode['color'] = '#ccffcc'
+                cnode.color = '#ccffcc'
             elif n.getSeverity() == "moderate":
-                cnode['color'] = '#ffff99'
+                cnode.color = '#ffff99'
             elif n.getSeverity() == "severe":
-                cnode['color'] = '#ff8080'
+                cnode.color = '#ff8080'
             else:
-                cnode['color'] = lightgray
+                cnode.color = lightgray
         elif type(n) is epoct.Question2:
-            cnode['shape'] = 'box'
-            cnode['color'] = '#bcbd22'
+            cnode.shape = 'box'
+            cnode.color = '#bcbd22'
         elif type(n) is epoct.DiagnosisSequence:
-            cnode['shape'] = 'octagon'
-            cnode['color'] = 'orange'
+            cnode.shape = 'octagon'
+            cnode.color = 'orange'
         elif type(n) is epoct.QuestionSequence:
-            cnode['shape'] = 'octagon'
-            cnode['color'] = cqs
+            cnode.shape = 'octagon'
+            cnode.color = cqs
         else:
-            cnode['shape'] = 'octagon'
-            cnode['color'] = lightgray
-        self._nodes.append(cnode)
-
-    def addHTMLQANode(self, q, a, question_seqs):
-        cnode = {}
-        cnode['node']  = q
-        cnode['id']  = "struct{}".format(q.getID())
+            cnode.shape = 'octagon'
+            cnode.color = lightgray
+        self.addNode(cnode)
+
+    def addHTMLQANode(self, q, a):
+        key = struct_name(q.getID())
+        if key in self._nodes:
+            self.addAnswer(a)
+            self._added.append(self._nodes[key])
+            return
+        cnode = NodeRecord()
+        cnode.node  = q
+        cnode.id  = key
+        cnode.label, cnode.bgcolor, cnode.answer_labels, cnode.answer_indices = LABELS.get(('table', type(q), q.getID()), self.tableLabel, q)
+        cnode.shape = 'plain'
+        self.addAnswer(a)
+        self.addNode(cnode)
+        self._added.append(cnode)
+
+    def tableLabel(self, q):
+        # Label, background color, answer labels and answer IDs of the HTML table of q
+        label = bgcolor = None
         qlbl = format_reflbl(q)
         max_len = max(10, int(round(len(qlbl)/1.8, 0)))
         if type(q) is epoct.Question:
-            cnode['label'] = "<B>" + wrap2_text(qlbl, max_len) + "</B>"
+            label = "<B>" + wrap2_text(qlbl, max_len) + "</B>"
             if q.getCategory() == "background_calculation":
-                cnode['bgcolor'] = gray 
+                bgcolor = gray 
             else:
-                cnode['bgcolor'] = '#bcbd22'
+                bgcolor = '#bcbd22'
         elif type(q) is epoct.QuestionSequence:
-            for q2 in question_seqs:
-                if q.getID() == q2.getID():
-                    qlbl = "<B>" + qlbl + "</B><br />" + q2.displaySequenceText()
-            cnode['label'] = wrap2_text(qlbl, max_len)
-            cnode['bgcolor'] = cqs
-        cnode['answers'] = []
-        cnode['answer_labels'] = []
-        cnode['answer_indices'] = []
-        cnode['answer_bgcolors'] = []
-        for child in q.getChildren():
-            clbl = format_albl(child)
-            cnode['answers'].append(child)
-            cnode['answer_labels'].append(clbl)
-            cnode['answer_indices'].append(child.getID())
-            cnode['answer_bgcolors'].append(white)
-        if self._horizontal:
-            cnode['html_label'] = html_format(cnode['label'], cnode['bgcolor'], cnode['answer_labels'], cnode['answer_indices'], cnode['answer_bgcolors'])
-        else:
-            cnode['html_label'] = html_format_vert(cnode['label'], cnode['bgcolor'], cnode['answer_labels'], cnode['answer_indices'], cnode['answer_bgcolors'])
-        cnode['shape'] = 'plain'
-        self.addAnswer(a)
-        self._nodes.append(cnode)
+            q2 = self._index.getSequence(q.getID())
+            if q2 is not None:
+                qlbl = "<B>" + qlbl + "</B><br />" + q2.displaySequenceText()
+            label = wrap2_text(qlbl, max_len)
+            bgcolor = cqs
+        answers = q.getChildren()
+        return label, bgcolor, tuple(format_albl(child) for child in answers), tuple(child.getID() for child in answers)
+
+    def addView(self, view):
+        # Add the nodes and links of a view extracted from the AlgoGraph
+        graph = self._index.getGraph()
+        for kind, child, parent, answer in view.items:
+            n = graph.getObject(child)
+            if kind == 'node':
+                self.addSimpleNode(n)
+            elif kind == 'excludes':
+                self.addEdge4(n, graph.getObject(parent))
+            else:
+                q = graph.getObject(parent)
+                a = graph.getObject(answer)
+                if type(q) is epoct.Question or type(q) is epoct.QuestionSequence:
+                    self.addHTMLQANode(q, a)
+                else:
+                    self.addSimpleNode(q)
+                self.addEdge(n, q, a)
 
-    def addParentQuestions(self, n, question_seqs):
+    def addParentQuestions(self, n):
         for q, a in zip(n.getGrandParents(), n.getParents()):
             # Exclude management and treatment questions at this stage
             if q.getCategory() not in ["management", "treatment_question"]:
-                self.addHTMLQANode(q, a, question_seqs)
+                self.addHTMLQANode(q, a)
                 self.addEdge(n, q, a)
 
-    def highlightAnswers(self):
-        for n in self.getNodes():
-            if type(n['node']) is epoct.Question:
-                if n['node'].getCategory() == "background_calculation":
-                    asw_color = lightgray
-                else:
-                    asw_color = '#dbdb8d'
-                for a2 in self.getAnswers():
-                    if a2.getID() in n['answer_indices']:
-                        idx = n['answer_indices'].index(a2.getID())
-                        n['answer_bgcolors'][idx] = asw_color
-                if self._horizontal: 
-                    n['html_label'] = html_format(n['label'], n['bgcolor'], n['answer_labels'], n['answer_indices'], n['answer_bgcolors'])
-                else:
-                    n['html_label'] = html_format_vert(n['label'], n['bgcolor'], n['answer_labels'], n['answer_indices'], n['answer_bgcolors'])
-            elif type(n['node']) is epoct.QuestionSequence:
-                for a2 in self.getAnswers():
-                    if a2.getID() in n['answer_indices']:
-                        idx = n['answer_indices'].index(a2.getID())
-                        n['answer_bgcolors'][idx] = cqsa
-                if self._horizontal:
-                    n['html_label'] = html_format(n['label'], n['bgcolor'], n['answer_labels'], n['answer_indices'], n['answer_bgcolors'])
-                else:
-                    n['html_label'] = html_format_vert(n['label'], n['bgcolor'], n['answer_labels'], n['answer_indices'], n['answer_bgcolors'])
-
-    def addShortSequence(self, question_seqs):
-        self.addParentQuestions(self._root['node'], question_seqs)
-        for s in self._root['node'].getSeq():
+    def htmlLabel(self, n):
+        # Highlight the recorded answers; built once per node and highlighting
+        highlighted = tuple(i in self._answers for i in n.answer_indices)
+        if self._diff is not None:
+            # Diff colours are specific to a run, they stay out of the label cache
+            return self.formatTable(n, highlighted)
+        key = ('html', type(n.node), n.node.getID(), self._horizontal, highlighted)
+        return LABELS.get(key, self.formatTable, n, highlighted)
+
+    def formatTable(self, n, highlighted):
+        if type(n.node) is epoct.QuestionSequence:
+            asw_color = cqsa
+        elif n.node.getCategory() == "background_calculation":
+            asw_color = lightgray
+        else:
+            asw_color = '#dbdb8d'
+        bgcolors = [asw_color if h else white for h in highlighted]
+        bgcolor, albls, indices = n.bgcolor, n.answer_labels, n.answer_indices
+        if self._diff is not None:
+            bgcolor, albls, indices, bgcolors = self.diffColors(n, albls, indices, bgcolors)
+        if self._horizontal:
+            return html_format(n.label, bgcolor, albls, indices, bgcolors)
+        else:
+            return html_format_vert(n.label, bgcolor, albls, indices, bgcolors)
+
+    def diffColors(self, n, albls, indices, bgcolors):
+        # Colour the question and answers added or changed, and append the
+        # removed answers, struck through
+        qid = n.node.getID()
+        status = self._diff.nodeStatus(qid)
+        bgcolor = diff_colors[status] if status is not None else n.bgcolor
+        bgcolors = [diff_colors.get(self._diff.answerStatus(qid, i), c) for i, c in zip(indices, bgcolors)]
+        removed = self._diff.removedAnswers(qid)
+        albls = list(albls) + ["<S>{}</S>".format(wrap_text(lbl.translate(escapes), 20)) for _, lbl in removed]
+        indices = list(indices) + [i for i, _ in removed]
+        bgcolors += [diff_colors['removed']] * len(removed)
+        return bgcolor, albls, indices, bgcolors
+
+    def addShortSequence(self):
+        self.addParentQuestions(self._root.node)
+        for s in self._root.node.getSeq():
             if type(s) is epoct.Question:
-                self.addParentQuestions(s, question_seqs)
+                self.addParentQuestions(s)
             if type(s) is epoct.QuestionSequence:
-                grand_parents, _ = analyse_seq(s, question_seqs)
+                grand_parents, _ = self._index.analyseSequence(s)
                 for q, a in zip(s.getGrandParents(), s.getParents()):
                     if q.getID() not in grand_parents:
-                        self.addHTMLQANode(q, a, question_seqs)
+                        self.addHTMLQANode(q, a)
                         self.addEdge(s, q, a)
-        self.highlightAnswers()
 
-    def addShortDiagnosis(self, question_seqs):
-        for s in self._root['node'].getSeq():
+    def addShortDiagnosis(self):
+        self.addSequenceQuestions(self._root.node)
+
+    def addSequenceQuestions(self, n):
+        # Parent questions of the questions and sequences in the sequence of n
+        for s in n.getSeq():
             if type(s) is epoct.Question:
                 # Exclude treatment / management branches
                 if s.getCategory() not in ["management", "treatment_question"]:
-                    self.addParentQuestions(s, question_seqs)
-                    for q in self._root['node'].getSeq():
+                    self.addParentQuestions(s)
+                    for q in n.getSeq():
                         if q.getCategory() not in ["management", "treatment_question"]:
-                            self.addParentQuestions(s, question_seqs)
+                            self.addParentQuestions(s)
                             '''
                             fpp = s.getFormulaParent()
                             if fpp is not None:
@@ -305,276 +496,469 @@ class ClinicalAlgo():
                                 self.addEdge3(fpp, s)
                             '''
             elif type(s) is epoct.QuestionSequence:
-                self.addParentQuestions(s, question_seqs)
-        self.highlightAnswers()
+                self.addParentQuestions(s)
 
-    def addShortFinalDiagnosis(self, question_seqs):
-        self.addParentQuestions(self._root['node'], question_seqs)
-        self.highlightAnswers()
+    def addShortFinalDiagnosis(self):
+        self.addParentQuestions(self._root.node)
 
     # Draw diagnosis sequence
-    def addDiagnosisSequence(self, final_diagnoses, question_seqs):
-        self.addShortDiagnosis(question_seqs)
+    def addDiagnosisSequence(self):
+        if self._builder == 'graph':
+            self.addView(self._index.getGraph().view(self._root.node, "mdfocus"))
+            return
+        self.addShortDiagnosis()
+        for fd in self._index.getFinalDiagnosesOf(self._root.id):
+            self.addFinalDiagnosis(fd)
+
+    def addFinalDiagnosis(self, fd):
+        md = fd.getMainDiagnosis()
+        if md is not None and md.getChiefComplaint() is not None:
+            self.addSimpleNode(md.getChiefComplaint())
+        self.addSimpleNode(fd)
+        self.addParentQuestions(fd)
+        # Add link to excluded diagnosis
+        for efd in fd.getExcludedFinalDiagnoses():
+            self.addSimpleNode(efd)
+            self.addEdge4(fd, efd)
+
+    def addMergedDiagnoses(self, final_diagnoses):
+        # Union of the trees of several final diagnoses, built in one pass: each
+        # one is drawn with the parent questions of its sequence, as
+        # addShortDiagnosis draws those of a root, and its own parent
+        # questions; the nodes and links they share are added once
+        if self._builder == 'graph':
+            self.addView(self._index.getGraph().mergedView(final_diagnoses))
+            return
         for fd in final_diagnoses:
-            md = fd.getMainDiagnosis()
-            cc = md.getChiefComplaint()
-            if md.getID() == self._root['id']:
-                self.addSimpleNode(cc)
-                self.addSimpleNode(fd)
-                self.addParentQuestions(fd, question_seqs)
-                # Add link to excluded diagnosis
-                for efd in fd.getExcludedFinalDiagnoses():
-                    self.addSimpleNode(efd)
-                    self.addEdge4(fd, efd)
-            self.highlightAnswers()
-
-    def addDiagnosesPerChiefComplaint(self, cc, main_diagnoses, final_diagnoses, question_seqs):
-        for md in main_diagnoses:
-            if md.getChiefComplaint().getID() == cc:
-                self.setRoot(md)
-                self.addDiagnosisSequence(final_diagnoses, question_seqs)
-
-    def addFullSequence(self, question_seqs):
+            self.addSimpleNode(fd)
+            self.addSequenceQuestions(fd)
+            self.addParentQuestions(fd)
+
+    def addDiagnosesPerChiefComplaint(self, cc):
+        for md in self._index.getMainDiagnosesOf(cc):
+            self.setRoot(md)
+            self.addDiagnosisSequence()
+
+    def addFullSequence(self):
         # Nodes linked with root node
-        for q, a in zip(self._root['node'].getGrandParents(), self._root['node'].getParents()):
-            self.addHTMLQANode(q, a, question_seqs)
-            self.addEdge(self._root['node'], q, a)
+        for q, a in zip(self._root.node.getGrandParents(), self._root.node.getParents()):
+            self.addHTMLQANode(q, a)
+            self.addEdge(self._root.node, q, a)
         # Loop on the sequence of nodes
         parents = {}
         start_nodes = {}
-        for s in self._root['node'].getSeq():
+        for s in self._root.node.getSeq():
             parents[s.getID()] = []
             start_nodes[s.getID()] = []
             for q, a in zip(s.getGrandParents(), s.getParents()):
-                self.addHTMLQANode(q, a, question_seqs)
+                self.addHTMLQANode(q, a)
                 if type(s) is epoct.Question:
                     self.addEdge(s, q, a) 
                 elif type(s) is epoct.QuestionSequence:
-                    pqs, start_nodes[s.getID()] = analyse_seq(s, question_seqs)
+                    pqs, start_nodes[s.getID()] = self._index.analyseSequence(s)
                     if q.getID() not in pqs:
                         parents[s.getID()].append((q, a))
         
-        for n in self.getNodes():
-            if type(n['node']) is epoct.QuestionSequence:
-                for n2 in question_seqs:
-                    if n2.getID() == n['node'].getID():
-                        for q, a in zip(n2.getGrandParents(), n2.getParents()):
-                            self.addHTMLQANode(q, a, question_seqs)
-                            for a2 in self.getAnswers():
-                                if a2.getID() in n['answer_indices']:
-                                    self.addEdge2(n2, a2, q, a)
-                        for s in n2.getSeq():
-                            if s.getID() not in parents:
-                                parents[s.getID()] = []
-                            for q, a in zip(s.getGrandParents(), s.getParents()):
-                                self.addHTMLQANode(q, a, question_seqs)
-                                if type(s) is epoct.Question:
-                                    self.addEdge(s, q, a)
-                                elif type(s) is epoct.QuestionSequence:
-                                    pqs, start_nodes[s.getID()] = analyse_seq(s, question_seqs)
-                                    if q.getID() not in pqs:
-                                        parents[s.getID()].append((q, a))
-                if n['node'].getID() in parents:
-                    for sn in start_nodes[n['node'].getID()]:
-                        for q2, a2 in parents[n['node'].getID()]:
+        for n in self._added:
+            if type(n.node) is epoct.QuestionSequence:
+                n2 = self._index.getSequence(n.node.getID())
+                if n2 is not None:
+                    for q, a in zip(n2.getGrandParents(), n2.getParents()):
+                        self.addHTMLQANode(q, a)
+                        for a2 in self.getAnswers():
+                            if a2.getID() in n.answer_indices:
+                                self.addEdge2(n2, a2, q, a)
+                    for s in n2.getSeq():
+                        if s.getID() not in parents:
+                            parents[s.getID()] = []
+                        for q, a in zip(s.getGrandParents(), s.getParents()):
+                            self.addHTMLQANode(q, a)
+                            if type(s) is epoct.Question:
+                                self.addEdge(s, q, a)
+                            elif type(s) is epoct.QuestionSequence:
+                                pqs, start_nodes[s.getID()] = self._index.analyseSequence(s)
+                                if q.getID() not in pqs:
+                                    parents[s.getID()].append((q, a))
+                if n.node.getID() in parents:
+                    for sn in start_nodes[n.node.getID()]:
+                        for q2, a2 in parents[n.node.getID()]:
                             self.addEdge(sn, q2, a2)
 
-        self.highlightAnswers()
-
-    def addFullDiagnosis(self, question_seqs):
-        for q, a in zip(self._root['node'].getGrandParents(), self._root['node'].getParents()):
-            self.addHTMLQANode(q, a, question_seqs)
-            self.addEdge(self._root['node'], q, a)
+    def addFullDiagnosis(self):
+        for q, a in zip(self._root.node.getGrandParents(), self._root.node.getParents()):
+            self.addHTMLQANode(q, a)
+            self.addEdge(self._root.node, q, a)
         parents = {}
         start_nodes = {}
-        for n in self.getNodes():
-            if type(n['node']) is epoct.QuestionSequence:
-                for n2 in question_seqs:
-                    if n2.getID() == n['node'].getID():
-                        for q, a in zip(n2.getGrandParents(), n2.getParents()):
-                            self.addHTMLQANode(q, a, question_seqs)
-                            for a2 in self.getAnswers():
-                                if a2.getID() in n['answer_indices']:
-                                    self.addEdge2(n2, a2, q, a)
-                        for s in n2.getSeq():
-                            if s.getID() not in parents:
-                                parents[s.getID()] = []
-                            for q, a in zip(s.getGrandParents(), s.getParents()):
-                                self.addHTMLQANode(q, a, question_seqs)
-                                if type(s) is epoct.Question:
-                                    self.addEdge(s, q, a)
-                                elif type(s) is epoct.QuestionSequence:
-                                    pqs, start_nodes[s.getID()] = analyse_seq(s, question_seqs)
-                                    if q.getID() not in pqs:
-                                        parents[s.getID()].append((q, a))
+        for n in self._added:
+            if type(n.node) is epoct.QuestionSequence:
+                n2 = self._index.getSequence(n.node.getID())
+                if n2 is not None:
+                    for q, a in zip(n2.getGrandParents(), n2.getParents()):
+                        self.addHTMLQANode(q, a)
+                        for a2 in self.getAnswers():
+                            if a2.getID() in n.answer_indices:
+                                self.addEdge2(n2, a2, q, a)
+                    for s in n2.getSeq():
+                        if s.getID() not in parents:
+                            parents[s.getID()] = []
+                        for q, a in zip(s.getGrandParents(), s.getParents()):
+                            self.addHTMLQANode(q, a)
+                            if type(s) is epoct.Question:
+                                self.addEdge(s, q, a)
+                            elif type(s) is epoct.QuestionSequence:
+                                pqs, start_nodes[s.getID()] = self._index.analyseSequence(s)
+                                if q.getID() not in pqs:
+                                    parents[s.getID()].append((q, a))
                        
-                if n['node'].getID() in start_nodes:
-                    for sn in start_nodes[n['node'].getID()]:
-                        for q2, a2 in parents[n['node'].getID()]:
+                if n.node.getID() in start_nodes:
+                    for sn in start_nodes[n.node.getID()]:
+                        for q2, a2 in parents[n.node.getID()]:
                             self.addEdge(sn, q2, a2)
 
-        self.highlightAnswers()
-
     def addEdge(self, n, q, a):
-        e = {}
-        e["style"] = 'solid'
-        e['color'] = 'black'
+        e = EdgeRecord()
+        e.style = 'solid'
+        e.color = 'black'
         if type(q) is epoct.Question:
-            e['label'] = q.getScore()
+            e.label = q.getScore()
         else:
-            e['label'] = ""
+            e.label = ""
         if type(q) is epoct.Question or type(q) is epoct.QuestionSequence:
-            e['id1'] = "struct{}".format(q.getID())
-            e['tailport'] = "f{}".format(a.getID())
-            e['key'] ="{}.{}".format(e['id1'], e['tailport'])
+            e.id1 = struct_name(q.getID())
+            e.tailport = port_name(a.getID())
+            e.key ="{}.{}".format(e.id1, e.tailport)
         else:
-            e['id1'] = q.getID()
-            e['key'] = "{}".format(e['id1'])
-        if n.getID() == self._root['id']:
-            e['id2'] = "{}".format(self._root['id'])
+            e.id1 = q.getID()
+            e.key = "{}".format(e.id1)
+        if n.getID() == self._root.id:
+            e.id2 = "{}".format(self._root.id)
         else:
             if type(n) is epoct.Question or type(n) is epoct.QuestionSequence:
-                e['id2'] = "struct{}".format(n.getID())
+                e.id2 = struct_name(n.getID())
                 if self._horizontal:
-                    e['headport'] = "e"
+                    e.headport = "e"
                 else:
-                    e['headport'] = "n"
+                    e.headport = "n"
             else:
-                e['id2'] = n.getID()
-        e['key'] = e['key']+"-{}".format(e['id2'])
-        self._edges.append(e)
+                e.id2 = n.getID()
+        e.key = e.key+"-{}".format(e.id2)
+        self.storeEdge(e)
 
     def addEdge2(self, q1, a1, q2, a2):
-        e = {}
-        e["style"] = 'solid'
-        e['color'] = cqs
-        e['label'] = q2.getScore()
-        e['id1'] = "struct{}".format(q2.getID())
-        e['tailport'] = "f{}".format(a2.getID())
-        e['key'] ="{}.{}".format(e['id1'], e['tailport'])
-        e['id2'] = "struct{}".format(q1.getID())
-        e['headport'] = "f{}".format(a1.getID())
-        e['key'] = e['key']+"-{}".format(e['id2'], e['headport'])
-        self._edges.append(e)
+        e = EdgeRecord()
+        e.style = 'solid'
+        e.color = cqs
+        e.label = q2.getScore()
+        e.id1 = struct_name(q2.getID())
+        e.tailport = port_name(a2.getID())
+        e.key ="{}.{}".format(e.id1, e.tailport)
+        e.id2 = struct_name(q1.getID())
+        e.headport = port_name(a1.getID())
+        e.key = e.key+"-{}".format(e.id2, e.headport)
+        self.storeEdge(e)
 
     def addEdge3(self, n, q):
-        e = {}
-        e["style"] = 'solid'
-        e['color'] = 'black'
-        e['label'] = ""
-        e['id1'] = n.getID()
-        e['tailport'] = ""
-        e['key'] ="{}.{}".format(e['id1'], e['tailport'])
-        e['id2'] = "struct{}".format(q.getID())
-        e['headport'] = ""
-        e['key'] = e['key']+"-{}".format(e['id2'], e['headport'])
-        self._edges.append(e)
+        e = EdgeRecord()
+        e.style = 'solid'
+        e.color = 'black'
+        e.label = ""
+        e.id1 = n.getID()
+        e.tailport = ""
+        e.key ="{}.{}".format(e.id1, e.tailport)
+        e.id2 = struct_name(q.getID())
+        e.headport = ""
+        e.key = e.key+"-{}".format(e.id2, e.headport)
+        self.storeEdge(e)
 
     def addEdge4(self, fd, excluded_fd):
-        e = {}
-        e["style"] = 'dashed'
-        e['color'] = 'black'
-        e['label'] = "excludes"
-        e['id1'] = fd.getID()
-        e['tailport'] = ""
-        e['key'] ="{}.{}".format(e['id1'], e['tailport'])
-        e['id2'] = excluded_fd.getID()
-        e['headport'] = ""
-        e['key'] = e['key']+"-{}".format(e['id2'], e['headport'])
-        self._edges.append(e)
+        e = EdgeRecord()
+        e.style = 'dashed'
+        e.color = 'black'
+        e.label = "excludes"
+        e.id1 = fd.getID()
+        e.tailport = ""
+        e.key ="{}.{}".format(e.id1, e.tailport)
+        e.id2 = excluded_fd.getID()
+        e.headport = ""
+        e.key = e.key+"-{}".format(e.id2, e.headport)
+        self.storeEdge(e)
 
     def addEdges(self, n):
         for q, a in zip(n.getGrandParents(), n.getParents()):
             self.addEdge(n, q, a)
 
-    def createTree(self, n, question_seqs, main_diagnoses, final_diagnoses, outdir, mode):
+    def buildTree(self, n, mode):
+        # Build the tree of n in mode, returning the name of its PNG file
         self.setRoot(n)
         if mode == "short":
-            pngfile = os.path.join(outdir, "{}-short.png".format(n.getReference()))
-            if type(n) is epoct.QuestionSequence:
-                self.addShortSequence(question_seqs)
+            pngfile = "{}-short.png".format(n.getReference())
+            if self._builder == 'graph':
+                self.addView(self._index.getGraph().view(n, mode))
+            elif type(n) is epoct.QuestionSequence:
+                self.addShortSequence()
             elif type(n) is epoct.DiagnosisSequence:
-                self.addShortDiagnosis(question_seqs)
+                self.addShortDiagnosis()
             elif type(n) is epoct.FinalDiagnosis:
-                self.addShortFinalDiagnosis(question_seqs)
+                self.addShortFinalDiagnosis()
         elif mode == "full":
-            pngfile = os.path.join(outdir, "{}-full.png".format(n.getReference()))
-            if type(n) is epoct.QuestionSequence:
-                self.addFullSequence(question_seqs)
+            pngfile = "{}-full.png".format(n.getReference())
+            if self._builder == 'graph':
+                self.addView(self._index.getGraph().view(n, mode))
+            elif type(n) is epoct.QuestionSequence:
+                self.addFullSequence()
             elif type(n) is epoct.DiagnosisSequence or type(n) is epoct.FinalDiagnosis:
-                self.addFullDiagnosis(question_seqs)
+                self.addFullDiagnosis()
         elif mode == "mdfocus":
             lbl = n.getLabel().replace("/", " - ").replace(":", " - ")
             idx = lbl.find('(')
             if idx>-1:
                 lbl = lbl[:idx]
             if type(n) is epoct.DiagnosisSequence:
-                pngfile = os.path.join(outdir, "{} {}.png".format(n.getReference(), lbl))
-                self.addDiagnosisSequence(final_diagnoses, question_seqs)
+                pngfile = "{} {}.png".format(n.getReference(), lbl)
+                self.addDiagnosisSequence()
             else:
-                pngfile = os.path.join(outdir, "{}.png".format(n.getReference()))
-                self.addDiagnosesPerChiefComplaint(n.getID(), main_diagnoses, final_diagnoses, question_seqs)
+                pngfile = "{}.png".format(n.getReference())
+                self.addDiagnosesPerChiefComplaint(n.getID())
         self.addEdges(n)
+        return pngfile
+
+    def createTree(self, n, outdir, mode, cache=None, formats=('png',), scheduler=None):
+        start = start_stage()
+        pngfile = os.path.join(outdir, self.buildTree(n, mode))
+        if self._diff is not None:
+            # Review copy, next to the tree exported as the algorithm
+            root, ext = os.path.splitext(pngfile)
+            pngfile = "{}-diff{}".format(root, ext)
+        end_stage('build', start, self._timings, self._memory)
+        start = start_stage()
+        self.buildLabels()
+        end_stage('labels', start, self._timings, self._memory)
+        start = start_stage()
         self.draw()
-        
-        self.export2png(pngfile)
-
-def analyse_seq(s, question_seqs):
-    for qs in question_seqs:
-        if qs.getID() == s.getID():
-            parent_nodes = [gp.getID() for gp in qs.getGrandParents()]
-            start_nodes = []
-            for n in qs.getSeq():
-                if type(n) is epoct.Question:
-                    if not n.getGrandParents():
-                        start_nodes.append(n)
-                elif type(n) is epoct.QuestionSequence:
-                    _, sns = analyse_seq(n, question_seqs)
-                    for n2 in sns:
-                        start_nodes.append(n2)
-            return parent_nodes, start_nodes
-
-def plot_nodes(nodes, question_seqs, main_diagnoses, final_diagnoses, outdir, mode="short"):
-    
-    for n in nodes:
-        print("{} - {}".format(n.getID(), n.getReference()))
-        g = ClinicalAlgo(horizontal=False)
-        g.createTree(n, question_seqs, main_diagnoses, final_diagnoses, outdir, mode)
-        del g
-
-def mergeDiagnoses(final_diagnoses_to_test, test_id, question_seqs, main_diagnoses, final_diagnoses, outdir):
+        end_stage('draw', start, self._timings, self._memory)
+        # Layout and output files, timed per step by render()
+        start = start_stage()
+        self.export(output_files(pngfile, formats), cache, scheduler, n)
+        end_stage('export', start, {}, self._memory)
+
+    def export(self, outputs, cache=None, scheduler=None, node=None):
+        try:
+            # Skip layout and rendering of the outputs unchanged since the last run
+            if cache is not None:
+                source = self.source()
+                outputs = {fmt: f for fmt, f in outputs.items() if not cache.isFresh(f, source)}
+                if not outputs:
+                    return False
+                cache.release(outputs.values())
+            if scheduler is not None:
+                # Laid out in the background by a LayoutScheduler, which then owns
+                # the temporary DOT file; node names the layout in its report
+                if self._backend != 'stream':
+                    raise ValueError("The layout scheduler needs the 'stream' backend")
+                on_success = None
+                if cache is not None:
+                    on_success = partial(cache.storeLayout, list(outputs.values()), source)
+                scheduler.submit(node or self._root.node, self._dotfile, outputs, on_success, self._dottemp, self._prog)
+                self._dottemp = None
+                return True
+            self.render(outputs)
+            if cache is not None:
+                for f in outputs.values():
+                    cache.store(f, source)
+            return True
+        finally:
+            if self._dottemp is not None:
+                os.remove(self._dottemp)
+                self._dottemp = None
+
+def render_node(n, index, outdir, mode, cache, formats, backend, builder, scheduler, layout, diff, trace_memory):
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    g = ClinicalAlgo(index, horizontal=False, backend=backend, builder=builder, layout=layout, diff=diff)
+    g.createTree(n, outdir, mode, cache, formats, scheduler)
+    return g.getProfile()
+
+def render_image(n, index, mode, fmt='png', backend='agraph', builder='walk', layout=None):
+    # Image of the tree of n as bytes, for packagers writing it straight into an archive
+    g = ClinicalAlgo(index, horizontal=False, backend=backend, builder=builder, layout=layout)
+    g.buildTree(n, mode)
+    g.draw()
+    return g.pipe(fmt)
+
+def plot_nodes(nodes, index, outdir, mode="short", workers=1, cache=None, formats=('png',), backend='agraph', profile=None, builder='walk', scheduler=None, layouts=None, diff=None, highlight=False):
+    # workers > 1 (or None for one per core) spreads the trees over a process pool
+    # cache (a RenderCache) skips the trees whose graph has not changed
+    # formats lists the exporters to write from the single layout of each tree
+    # backend 'stream' writes DOT text directly instead of building AGraphs
+    # profile (a RunProfile) records every tree and reports once the batch is done
+    # builder 'graph' extracts the trees from the AlgoGraph, built here once for
+    # all workers; it has no full trees, only drawn by the walk
+    if builder == 'graph':
+        if mode == "full":
+            raise ValueError("The graph builder draws short and mdfocus trees, use builder='walk' for full trees")
+        index.getGraph()
+    # scheduler (a LayoutScheduler, 'stream' backend) lays the trees out in the
+    # background, with timeouts and fallbacks, while they are built here one by one
+    if scheduler is not None:
+        workers = 1
+    # layouts maps modes to overrides of the size-based layout strategy ({}
+    # for the automatic choice); None, or a mode missing from it, keeps dot
+    # with spline routing
+    layout = layouts.get(mode) if layouts is not None else None
+    # diff (an AlgoDiff) only renders the trees drawing nodes changed since the
+    # previous version of the algorithm; with highlight, each is also written
+    # with the changes coloured, as a -diff copy of its files
+    if diff is not None:
+        affected = diff.affected(nodes, index, mode)
+        print("{} of {} trees affected by the changes".format(len(affected), len(nodes)))
+        nodes = affected
+    trace_memory = profile is not None and profile.traceMemory() and not tracemalloc.is_tracing()
+    on_result = None
+    if profile is not None:
+        on_result = lambda n, result: profile.addTree(n, mode, result)
+    failures = render_batch(render_node, nodes, (index, outdir, mode, cache, formats, backend, builder, scheduler, layout, None, trace_memory), workers, on_result)
+    if diff is not None and highlight:
+        failures += render_batch(render_node, nodes, (index, outdir, mode, cache, formats, backend, builder, scheduler, layout, diff, trace_memory), workers)
+    if scheduler is not None:
+        layouts_run = scheduler.wait()
+        if profile is not None:
+            profile.addLayouts(mode, layouts_run)
+        failures += [(r['node'], r['error']) for r in report_layouts(layouts_run)]
+    if trace_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    if profile is not None:
+        profile.report()
+        profile.writeCSV()
+    return failures
+
+def mergeDiagnoses(final_diagnoses_to_test, test_id, index, outdir, cache=None, formats=('png',), backend='agraph', builder='walk'):
     pngfile = os.path.join(outdir, "Test{}.png".format(test_id))
-    g = ClinicalAlgo(horizontal=False)
+    g = ClinicalAlgo(index, horizontal=False, backend=backend, builder=builder)
     print(final_diagnoses_to_test)
+    g.addMergedDiagnoses(final_diagnoses_to_test)
     for n in final_diagnoses_to_test:
-        g.setRoot(n)
-        g.addDiagnosisSequence(final_diagnoses, question_seqs)
         g.addEdges(n)
     g.draw()
-    g.export2png(pngfile)
-
-if __name__ == '__main__':
-
-    # Load category coding
-    ctg_code = loadCategoryCoding(CLINICAL_KEYS_PATH, 'category codes')
-
-    # Load diagnosis severity
-    severity_df = loadDiagnosisSeverity2(CLINICAL_KEYS_PATH, 'DYNAMIC diagnoses')
+    g.export(output_files(pngfile, formats), cache)
+
+def read_json(path, profile=None, streaming=False):
+    # The MedAL-C json file as read by extract_nodes: whole with AlgoReader, or
+    # only the sections extract_nodes needs, parsed incrementally with ijson
+    if streaming:
+        with profile_stage(profile, 'load_sections'):
+            return load_sections(path)
+    with profile_stage(profile, 'AlgoReader'):
+        return algoreader.AlgoReader(path).getData()
+
+def load_algorithm(profile=None, streaming=False, data=None, keys=None):
+    # data (the json file, already read by read_json) and keys (the category
+    # coding and diagnosis severity, already loaded) are not read again
+
+    if keys is None:
+        # Load category coding
+        ctg_code = loadCategoryCoding(CLINICAL_KEYS_PATH, 'category codes')
+
+        # Load diagnosis severity
+        severity_df = loadDiagnosisSeverity2(CLINICAL_KEYS_PATH, 'DYNAMIC diagnoses')
+    else:
+        ctg_code, severity_df = keys
     
     # Import data from MedAL-C json file
-    algo = algoreader.AlgoReader(JSON_PATH)
-    data = algo.getData()
+    if data is None:
+        data = read_json(JSON_PATH, profile, streaming)
 
     # Extract node structure
-    main_diagnosis_nodes, final_diagnosis_nodes, cc_nodes, question_seq_nodes = read_epoct_json2.extract_nodes(data, severity_df)
-
-    # Plot question sequences
-    mode = "short"
-    #plot_nodes(question_seq_nodes, question_seq_nodes, main_diagnosis_nodes, final_diagnosis_nodes, os.path.join(OUTPUT_DIR, "question_sequences"), mode)
-    #mode = "full"
-    #plot_nodes(question_seq_nodes, question_seq_nodes, main_diagnosis_nodes, final_diagnosis_nodes, os.path.join(OUTPUT_DIR, "question_sequences"), mode)
-    mode = "mdfocus"
-    plot_nodes(main_diagnosis_nodes, question_seq_nodes, main_diagnosis_nodes, final_diagnosis_nodes, os.path.join(OUTPUT_DIR, "diagnoses"), mode)
-    #plot_nodes(cc_nodes, question_seq_nodes, main_diagnosis_nodes, final_diagnosis_nodes, os.path.join(OUTPUT_DIR, "cc"), mode)
-    #mode = "short"
-    #plot_nodes(final_diagnosis_nodes, question_seq_nodes, main_diagnosis_nodes, final_diagnosis_nodes, os.path.join(OUTPUT_DIR, "final_diagnoses"), mode)
\ No newline at end of file
+    with profile_stage(profile, 'extract_nodes'):
+        main_diagnosis_nodes, final_diagnosis_nodes, cc_nodes, question_seq_nodes = read_epoct_json2.extract_nodes(data, severity_df)
+
+    return ctg_code, severity_df, main_diagnosis_nodes, final_diagnosis_nodes, cc_nodes, question_seq_nodes
+
+if __name__ == '__main__':
+
+    # Per-stage profiling of the run, reported after each plot_nodes (None: off)
+    profile = None
+    #profile = RunProfile(os.path.join(OUTPUT_DIR, "profile.csv"))
+
+    # Load the algorithm from its snapshot, rebuilt when the clinical keys, the
+    # MedAL-C json file or the reading and extraction code change
+    snapshot_file = os.path.join(cache_dir_for(OUTPUT_DIR), "algorithm.pickle")
+    sources = [JSON_PATH, CLINICAL_KEYS_PATH, read_epoct_json2.__file__, algoreader.__file__, epoct.__file__, utils.__file__]
+    # Stream the json file instead of loading it whole (needs ijson to save memory)
+    streaming = False
+
+    # Keep running and re-render the trees affected by each change of the
+    # algorithm files, once they stop changing for debounce seconds (False: run once)
+    watching = False
+    if watching:
+        # The watch starts from the files as read here, before the first render,
+        # which draws the algorithm extracted from the same parse: the changes
+        # saved while it runs are rendered next
+        data, stamps = read_baseline(JSON_PATH, [CLINICAL_KEYS_PATH], lambda path: read_json(path, profile, streaming))
+        ctg_code, severity_df, main_diagnosis_nodes, final_diagnosis_nodes, cc_nodes, question_seq_nodes = load_algorithm(profile, streaming, data)
+        # Only the node sections of data are kept, for the first diff
+        baseline = (node_sections(data), stamps)
+        del data
+    else:
+        ctg_code, severity_df, main_diagnosis_nodes, final_diagnosis_nodes, cc_nodes, question_seq_nodes = load_snapshot(snapshot_file, sources, lambda: load_algorithm(profile, streaming))
+
+    # Index the node structure once for all the trees
+    index = AlgoIndex(main_diagnosis_nodes, final_diagnosis_nodes, question_seq_nodes)
+
+    # Number of rendering processes (None: one per core)
+    workers = None
+
+    # Only re-render the trees whose graph changed since the previous run; the
+    # rendered files are deduplicated by content into the artifact store
+    store = ArtifactStore(os.path.join(cache_dir_for(OUTPUT_DIR), "artifacts"))
+    cache = RenderCache(cache_dir_for(OUTPUT_DIR), store)
+
+    # Formats written from the layout of each tree (see exporters.EXPORTERS)
+    formats = ['png']
+
+    # 'agraph' builds pygraphviz graphs, 'stream' writes DOT text for a single dot run
+    backend = 'agraph'
+
+    # 'walk' follows the epoct links of each tree, 'graph' extracts it from the AlgoGraph
+    builder = 'walk'
+
+    # Background layouts with a timeout per graph and cheaper fallback engines
+    # (needs the 'stream' backend; None: layouts run in line)
+    scheduler = None
+    #scheduler = LayoutScheduler(timeout=120)
+
+    # Layout picked from the size of each tree, per mode, with overrides of the
+    # automatic choice (None: dot with spline routing for every tree)
+    layouts = None
+    #layouts = {'short': {}, 'full': {}, 'mdfocus': {'splines': 'polyline'}}
+
+    # Only render the trees affected by the changes since a previous version of
+    # the algorithm, optionally with the changes coloured (None: every tree)
+    diff = None
+    #diff = AlgoDiff.fromFiles(os.path.join(OUTPUT_DIR, "previous.json"), JSON_PATH)
+    highlight = False
+
+    def plot(diff):
+        # Plot question sequences
+        mode = "short"
+        #plot_nodes(question_seq_nodes, index, os.path.join(OUTPUT_DIR, "question_sequences"), mode, workers, cache, formats, backend, profile, builder, scheduler, layouts, diff, highlight)
+        #mode = "full"
+        #plot_nodes(question_seq_nodes, index, os.path.join(OUTPUT_DIR, "question_sequences"), mode, workers, cache, formats, backend, profile, builder, scheduler, layouts, diff, highlight)
+        mode = "mdfocus"
+        plot_nodes(main_diagnosis_nodes, index, os.path.join(OUTPUT_DIR, "diagnoses"), mode, workers, cache, formats, backend, profile, builder, scheduler, layouts, diff, highlight)
+        #plot_nodes(cc_nodes, index, os.path.join(OUTPUT_DIR, "cc"), mode, workers, cache, formats, backend, profile, builder, scheduler, layouts, diff, highlight)
+        #mode = "short"
+        #plot_nodes(final_diagnosis_nodes, index, os.path.join(OUTPUT_DIR, "final_diagnoses"), mode, workers, cache, formats, backend, profile, builder, scheduler)
+    plot(diff)
+
+    if watching:
+        def update(diff, data):
+            # Extract the algorithm from the json file read for the diff, with the
+            # clinical keys reloaded only when they changed (diff None), and
+            # re-index it; the snapshot is rebuilt on the next start
+            global ctg_code, severity_df, main_diagnosis_nodes, final_diagnosis_nodes, cc_nodes, question_seq_nodes, index
+            keys = (ctg_code, severity_df) if diff is not None else None
+            ctg_code, severity_df, main_diagnosis_nodes, final_diagnosis_nodes, cc_nodes, question_seq_nodes = load_algorithm(profile, streaming, data, keys)
+            index = AlgoIndex(main_diagnosis_nodes, final_diagnosis_nodes, question_seq_nodes)
+            plot(diff)
+        watch_algorithm(JSON_PATH, [CLINICAL_KEYS_PATH], update, debounce=2.0, load=lambda path: read_json(path, profile, streaming), baseline=baseline)
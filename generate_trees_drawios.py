@@ -1,10 +1,9 @@
-from graphviz2drawio import graphviz2drawio
-
 import os
 from pygraphviz import *
 from copy import deepcopy
 from read_epoct_json2 import extract_nodes
 from epoct import Diagnosis, FinalDiagnosis, Question, QuestionSequence, Answer
+from exporters import render_layout, output_files, write_drawio
 
 lightgray = "#D3D3D3"
 gray = "#808080"
@@ -131,9 +130,12 @@ class ClinicalAlgo():
             else:
                 self._graph.add_edge(e['id1'], e['id2'])
     
+    def render(self, outputs, prog='dot'):
+        # Lay out once and write every format of outputs ({format: file}) from that layout
+        return render_layout(self._graph, outputs, prog)
+
     def export2png(self, pngfile):
-        self._graph.layout(prog='dot')
-        self._graph.draw(pngfile, prog='dot')
+        self.render({'png': pngfile})
 
     def addSimpleNode(self, n):
         cnode = {}
@@ -399,14 +401,10 @@ class ClinicalAlgo():
                 pngfile = os.path.join(outdir, "node{0:03d}-{1}-ccfocus2.png".format(n.getID(), format_4_filename(n)))
                 self.addDiagnosesPerChiefComplaint(main_diagnoses)
         self.draw_edges()
-        self.export2png(pngfile)
-        self.convert2drawio(pngfile.replace('png', 'xml'))
+        self.render(output_files(pngfile, ['png', 'drawio']))
 
     def convert2drawio(self, outfile):
-
-        xml = graphviz2drawio.convert(self._graph)
-        with open(outfile, 'w', encoding="utf8") as f:
-            f.write(xml)
+        write_drawio(self._graph, outfile)
 
 def analyse_seq(s, question_seqs):
     for qs in question_seqs:
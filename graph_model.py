@@ -0,0 +1,50 @@
+import sys
+
+###################
+# Graph records
+###################
+
+# Node names and ports are repeated by every edge touching the node: intern
+# them so that all the records of a process share a single string
+intern = sys.intern
+
+def struct_name(node_id):
+    # Name of the HTML table node drawn for a question or question sequence
+    return intern("struct{}".format(node_id))
+
+def port_name(answer_id):
+    return intern("f{}".format(answer_id))
+
+class NodeRecord():
+    """A node of a ClinicalAlgo tree.
+
+    Simple nodes use label, shape and color; the HTML table nodes of the
+    questions use label, bgcolor and the labels and (integer) IDs of their
+    answers. id is the epoct ID for simple nodes and the struct name for
+    table nodes. Colors and shapes are the module-level constants.
+    """
+    __slots__ = ('node', 'id', 'label', 'shape', 'color', 'bgcolor', 'answer_labels', 'answer_indices')
+
+    def __init__(self):
+        self.node           = None
+        self.id             = None
+        self.label          = None
+        self.shape          = None
+        self.color          = None
+        self.bgcolor        = None
+        self.answer_labels  = None
+        self.answer_indices = None
+
+class EdgeRecord():
+    """An edge of a ClinicalAlgo tree; tailport and headport are None when unset."""
+    __slots__ = ('id1', 'id2', 'key', 'tailport', 'headport', 'color', 'label', 'style')
+
+    def __init__(self):
+        self.id1      = None
+        self.id2      = None
+        self.key      = None
+        self.tailport = None
+        self.headport = None
+        self.color    = None
+        self.label    = None
+        self.style    = None
@@ -0,0 +1,55 @@
+import json
+
+try:
+    import ijson
+except ImportError:
+    # Optional: without ijson, the whole file is parsed by json.load
+    ijson = None
+
+###################
+# Streaming JSON loader
+###################
+
+# Metadata of a MedAL-C algorithm, as printed by generate_arborescence
+ALGORITHM_KEYS = ['id', 'algorithm_id', 'name', 'version', 'version_id', 'author', 'created_at', 'updated_at']
+
+# Sections of a MedAL-C algorithm read by extract_nodes: the media and
+# translations embedded by newer versions are left out
+NODE_SECTIONS = ['nodes', 'diagnostics', 'final_diagnostics']
+
+def load_sections(path, sections=ALGORITHM_KEYS + NODE_SECTIONS):
+    """Load only the given top-level keys of a JSON object file.
+
+    With ijson, the file is parsed incrementally: the values of the other
+    keys are skipped without ever being built, so peak memory is that of the
+    sections kept, and parsing stops once they have all been read. Without
+    ijson, the file is loaded whole and the other keys are dropped.
+    """
+    wanted = set(sections)
+    if ijson is None:
+        with open(path, encoding='utf8') as f:
+            data = json.load(f)
+        return {k: v for k, v in data.items() if k in wanted}
+
+    data = {}
+    builder = None
+    depth = 0
+    with open(path, 'rb') as f:
+        for prefix, event, value in ijson.parse(f, use_float=True):
+            if builder is None:
+                # Top-level values start with an event prefixed by their key alone
+                if prefix not in wanted or event == 'map_key':
+                    continue
+                key = prefix
+                builder = ijson.common.ObjectBuilder()
+            builder.event(event, value)
+            if event in ('start_map', 'start_array'):
+                depth += 1
+            elif event in ('end_map', 'end_array'):
+                depth -= 1
+            if depth == 0:
+                data[key] = builder.value
+                builder = None
+                if len(data) == len(wanted):
+                    break
+    return data
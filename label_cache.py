@@ -0,0 +1,46 @@
+###################
+# LabelCache class
+###################
+
+class LabelCache():
+    """Node labels computed once per process and reused by every tree.
+
+    Labels are keyed on what they depend on: the kind of label, the epoct
+    type and ID of the node and, for HTML tables, the orientation and the
+    highlighted answers. Node IDs and sequence texts are only unique within
+    one algorithm, so the labels belong to one index at a time: use(index)
+    drops them when the trees of another index are drawn. hits and misses
+    count the lookups since the process started.
+    """
+
+    def __init__(self):
+        self._labels = {}
+        self._owner = None
+        self.hits = 0
+        self.misses = 0
+
+    def use(self, owner):
+        # Labels of the trees of owner (an AlgoIndex), those of another dropped
+        if owner is not self._owner:
+            self.clear()
+            self._owner = owner
+
+    def get(self, key, build, *args):
+        # Label of key, built by build(*args) on the first lookup
+        label = self._labels.get(key)
+        if label is None:
+            self.misses += 1
+            label = self._labels[key] = build(*args)
+        else:
+            self.hits += 1
+        return label
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._labels)}
+
+    def clear(self):
+        self._labels = {}
+        self._owner = None
+
+# Shared by all the trees drawn in the process (each pool worker has its own)
+LABELS = LabelCache()
@@ -0,0 +1,123 @@
+import os
+import time
+import traceback
+from subprocess import TimeoutExpired
+from concurrent.futures import ThreadPoolExecutor
+
+from dot_writer import run_layout
+
+###################
+# Layout fallbacks
+###################
+
+# Layouts tried in turn while the previous one times out: (engine, graph
+# attribute overrides). Spline routing is the usual culprit, then dot itself.
+FALLBACKS = [
+    ('dot', {}),
+    ('dot', {'splines': 'false'}),
+    ('sfdp', {'splines': 'false', 'overlap': 'prism'}),
+]
+
+class LayoutTimeout(Exception):
+    def __init__(self, attempts):
+        Exception.__init__(self, "every layout timed out ({})".format(format_attempts(attempts)))
+        self.attempts = attempts
+
+def layout_with_fallback(dotfile, outputs, timeout=None, fallbacks=FALLBACKS):
+    """Run the layouts of fallbacks in turn until one finishes within timeout.
+
+    The attribute overrides are written into the DOT source of the attempt
+    (see dot_writer.run_layout), after those of the file and of the layout
+    strategy. Returns the list of attempts, dicts with the engine ('prog'),
+    the attribute overrides ('attrs'), the seconds spent ('time') and the
+    'status' ('ok' or 'timeout'); raises LayoutTimeout if all time out.
+    """
+    attempts = []
+    for prog, attrs in fallbacks:
+        start = time.perf_counter()
+        try:
+            run_layout(dotfile, outputs, prog, timeout, attrs)
+        except TimeoutExpired:
+            attempts.append({'prog': prog, 'attrs': attrs, 'time': time.perf_counter() - start, 'status': 'timeout'})
+            continue
+        attempts.append({'prog': prog, 'attrs': attrs, 'time': time.perf_counter() - start, 'status': 'ok'})
+        return attempts
+    raise LayoutTimeout(attempts)
+
+def format_attempts(attempts):
+    return ", ".join("{}{} {} {:.1f}s".format(a['prog'], format_attrs(a['attrs']), a['status'], a['time']) for a in attempts)
+
+def format_attrs(attrs):
+    if not attrs:
+        return ""
+    return "[{}]".format(",".join("{}={}".format(k, v) for k, v in attrs.items()))
+
+###################
+# LayoutScheduler class
+###################
+
+class LayoutScheduler():
+    """Run Graphviz layouts as subprocesses, a bounded number at a time.
+
+    submit() queues the layout of a DOT file and returns at once, so the
+    next trees can be built while Graphviz works. Each layout gets timeout
+    seconds per attempt before falling back to the next entry of fallbacks.
+    wait() blocks until every submitted layout is done and returns one
+    record per layout for the run report.
+    """
+
+    def __init__(self, max_jobs=None, timeout=None, fallbacks=FALLBACKS):
+        self._pool = ThreadPoolExecutor(max_workers=max_jobs or os.cpu_count() or 1)
+        self._timeout = timeout
+        self._fallbacks = fallbacks
+        self._jobs = []
+
+    def submit(self, n, dotfile, outputs, on_success=None, tmpfile=None, prog='dot'):
+        # on_success(attempts) runs once the outputs are written; tmpfile is removed
+        # when the layout is over, whatever its outcome. prog is the engine of
+        # the first attempt, the fallbacks following
+        fallbacks = [(prog, self._fallbacks[0][1])] + self._fallbacks[1:]
+        future = self._pool.submit(self._run, dotfile, outputs, on_success, tmpfile, fallbacks)
+        self._jobs.append((n, future))
+        return future
+
+    def _run(self, dotfile, outputs, on_success, tmpfile, fallbacks):
+        try:
+            attempts = layout_with_fallback(dotfile, outputs, self._timeout, fallbacks)
+            if on_success is not None:
+                on_success(attempts)
+            return attempts
+        finally:
+            if tmpfile is not None:
+                os.remove(tmpfile)
+
+    def wait(self):
+        # One {'node', 'attempts', 'error'} record per layout, in submission order
+        records = []
+        for n, future in self._jobs:
+            try:
+                records.append({'node': n, 'attempts': future.result(), 'error': None})
+            except LayoutTimeout as e:
+                records.append({'node': n, 'attempts': e.attempts, 'error': str(e)})
+            except Exception:
+                records.append({'node': n, 'attempts': [], 'error': traceback.format_exc()})
+        self._jobs = []
+        return records
+
+    def shutdown(self):
+        self._pool.shutdown()
+
+def report_layouts(records):
+    # Print the layouts that fell back to a cheaper engine or failed
+    fallbacks = [r for r in records if r['error'] is None and len(r['attempts']) > 1]
+    failures = [r for r in records if r['error'] is not None]
+    if fallbacks:
+        print("{} of {} layouts fell back:".format(len(fallbacks), len(records)))
+        for r in fallbacks:
+            print("{} - {}: {}".format(r['node'].getID(), r['node'].getReference(), format_attempts(r['attempts'])))
+    if failures:
+        print("{} of {} layouts failed:".format(len(failures), len(records)))
+        for r in failures:
+            print("--- {} - {}".format(r['node'].getID(), r['node'].getReference()))
+            print(r['error'])
+    return failures
@@ -0,0 +1,36 @@
+###################
+# Layout strategy
+###################
+
+# Size classes, the first one a graph fits in wins: (max nodes, max edges,
+# engine, graph attributes). Small trees keep the full spline routing; the
+# larger ones trade curve quality for time with polyline routing and lower
+# network simplex (nslimit), crossing minimization (mclimit) and ranking
+# (searchsize) effort.
+STRATEGIES = [
+    (150, 300, 'dot', {'splines': 'spline'}),
+    (500, 1000, 'dot', {'splines': 'polyline', 'nslimit': '4', 'mclimit': '0.5', 'searchsize': '50'}),
+    (None, None, 'dot', {'splines': 'polyline', 'nslimit': '1', 'nslimit1': '1', 'mclimit': '0.1', 'searchsize': '20'}),
+]
+
+# Beyond this size, graphs without ports nor edge labels get orthogonal
+# routing, which Graphviz cannot use with either
+ORTHO_MIN_NODES = 500
+
+def select_layout(nb_nodes, nb_edges, ports=False, labels=False, overrides=None):
+    """Return the engine and graph attributes to lay out a graph with.
+
+    ports tells whether edges attach to HTML table ports, labels whether
+    they carry text. overrides (a dict of graph attributes, plus 'prog' for
+    the engine) replace the automatic choice, e.g. per mode.
+    """
+    for max_nodes, max_edges, prog, attrs in STRATEGIES:
+        if (max_nodes is None or nb_nodes <= max_nodes) and (max_edges is None or nb_edges <= max_edges):
+            break
+    attrs = dict(attrs)
+    if nb_nodes > ORTHO_MIN_NODES and not ports and not labels:
+        attrs['splines'] = 'ortho'
+    if overrides:
+        attrs.update(overrides)
+        prog = attrs.pop('prog', prog)
+    return prog, attrs
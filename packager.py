@@ -0,0 +1,94 @@
+import io
+import time
+import tarfile
+import zipfile
+
+###################
+# Packager class
+###################
+
+# Archive formats by file extension, with the tarfile stream modes
+TAR_MODES = {'.tar': 'w|', '.tar.gz': 'w|gz', '.tgz': 'w|gz', '.tar.bz2': 'w|bz2', '.tar.xz': 'w|xz'}
+
+# Entries written as they are in ZIP archives: compressing them again is wasted time
+STORED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.pdf', '.zip', '.gz')
+
+def archive_format(path):
+    # 'zip' or the tar stream mode of an archive file name
+    name = path.lower()
+    if name.endswith('.zip'):
+        return 'zip'
+    for ext, mode in TAR_MODES.items():
+        if name.endswith(ext):
+            return mode
+    raise ValueError("Unknown archive format: {} (zip, {})".format(path, ", ".join(TAR_MODES)))
+
+class Packager():
+    """Write files into a ZIP or tar archive as they are produced.
+
+    target is an archive path or a writable binary stream (a pipe, a socket,
+    sys.stdout.buffer...): archives are written sequentially, without seeking,
+    so entries go out as soon as they are added. fmt is 'zip' or a tarfile
+    stream mode ('w|', 'w|gz'...), guessed from the path when None. Files are
+    copied in chunks and only one in-memory entry is held at a time, so the
+    memory used does not grow with the size of the archive.
+    """
+
+    def __init__(self, target, fmt=None):
+        if fmt is None:
+            if not isinstance(target, str):
+                raise ValueError("The archive format is needed to write to a stream")
+            fmt = archive_format(target)
+        self._fmt = fmt
+        if fmt == 'zip':
+            self._zip = zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED)
+            self._tar = None
+        else:
+            self._zip = None
+            if isinstance(target, str):
+                self._tar = tarfile.open(target, fmt)
+            else:
+                self._tar = tarfile.open(fileobj=target, mode=fmt)
+        self._count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def compressType(self, arcname):
+        if arcname.lower().endswith(STORED_EXTENSIONS):
+            return zipfile.ZIP_STORED
+        return zipfile.ZIP_DEFLATED
+
+    def addBytes(self, arcname, data):
+        arcname = arcname.replace("\\", "/")
+        if self._zip is not None:
+            info = zipfile.ZipInfo(arcname, time.localtime()[:6])
+            info.compress_type = self.compressType(arcname)
+            self._zip.writestr(info, data)
+        else:
+            info = tarfile.TarInfo(arcname)
+            info.size = len(data)
+            info.mtime = time.time()
+            self._tar.addfile(info, io.BytesIO(data))
+        self._count += 1
+
+    def addFile(self, arcname, path):
+        # Copied from path in chunks
+        arcname = arcname.replace("\\", "/")
+        if self._zip is not None:
+            self._zip.write(path, arcname, self.compressType(arcname))
+        else:
+            self._tar.add(path, arcname, recursive=False)
+        self._count += 1
+
+    def getCount(self):
+        return self._count
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+        else:
+            self._tar.close()
@@ -0,0 +1,161 @@
+import os
+import csv
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+from layout_scheduler import format_attempts
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows: the max RSS column stays empty
+    resource = None
+
+###################
+# Stage measures
+###################
+
+def start_stage():
+    # Start timing a stage; the Python memory peak is reset when tracing
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    return time.perf_counter()
+
+def end_stage(name, start, timings, memory):
+    timings[name] = time.perf_counter() - start
+    if tracemalloc.is_tracing():
+        memory[name] = tracemalloc.get_traced_memory()[1]
+
+def max_rss():
+    # Peak resident memory of the process so far, in bytes
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def profile_stage(profile, name):
+    # Time a run-level stage (JSON parsing, node extraction...) when profiling
+    if profile is None:
+        return nullcontext()
+    return profile.stage(name)
+
+###################
+# RunProfile class
+###################
+
+class RunProfile():
+    """Opt-in per-stage profile of a tree generation run.
+
+    Collects the run-level stages (AlgoReader parsing, extract_nodes...) and,
+    for every tree rendered by plot_nodes, the wall time and peak Python
+    memory (tracemalloc) of each stage with the node and edge counts, the
+    label cache hits and misses and the process max RSS, which also covers
+    Graphviz's own allocations. Layouts run by a LayoutScheduler are added
+    by addLayouts(), with their fallback attempts. report() prints the trees
+    sorted by total time, the slowest 1% flagged, and the layouts that fell
+    back; writeCSV() saves the same records for further analysis.
+    """
+
+    def __init__(self, csvfile, trace_memory=True):
+        self._csvfile = csvfile
+        self._trace_memory = trace_memory
+        self._stages = []
+        self._trees = []
+
+    def traceMemory(self):
+        return self._trace_memory
+
+    @contextmanager
+    def stage(self, name):
+        timings, memory = {}, {}
+        tracing = self._trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        start = start_stage()
+        try:
+            yield
+        finally:
+            end_stage(name, start, timings, memory)
+            if tracing:
+                tracemalloc.stop()
+            self._stages.append({'stage': name, 'time': timings[name], 'peak': memory.get(name)})
+
+    def addTree(self, n, mode, profile):
+        record = {'id': n.getID(), 'reference': n.getReference(), 'mode': mode}
+        record.update(profile)
+        record['total'] = sum(profile['timings'].values())
+        self._trees.append(record)
+
+    def addLayouts(self, mode, records):
+        # Layouts run in the background by a LayoutScheduler (records of its
+        # wait()): their attempts and time are added to the trees of mode
+        trees = {(r['id'], r['mode']): r for r in self._trees}
+        for record in records:
+            tree = trees.get((record['node'].getID(), mode))
+            if tree is None:
+                continue
+            tree['layouts'] = record['attempts']
+            elapsed = sum(a['time'] for a in record['attempts'])
+            tree['timings']['layout'] = tree['timings'].get('layout', 0.0) + elapsed
+            tree['total'] += elapsed
+
+    def getTrees(self):
+        return self._trees
+
+    def slowest(self):
+        # Trees sorted by decreasing total time, and how many form the slowest 1%
+        trees = sorted(self._trees, key=lambda r: r['total'], reverse=True)
+        return trees, max(1, len(trees) // 100) if trees else 0
+
+    def stageNames(self, key='timings'):
+        names = []
+        for r in self._trees:
+            names += [s for s in r[key] if s not in names]
+        return names
+
+    def report(self, out=None, limit=20):
+        out = out or sys.stdout
+        for s in self._stages:
+            print("{:<20} {:8.2f}s{}".format(s['stage'], s['time'], format_peak(s['peak'])), file=out)
+        trees, nb_slowest = self.slowest()
+        if not trees:
+            return
+        names = self.stageNames()
+        print("{} trees, {:.2f}s in total; slowest 1% marked with *".format(len(trees), sum(r['total'] for r in trees)), file=out)
+        print("  {:<12}{:<9}{:>8}{:>7}{:>7}".format("reference", "mode", "total", "nodes", "edges") + "".join("{:>9}".format(s) for s in names), file=out)
+        for i, r in enumerate(trees[:max(limit, nb_slowest)]):
+            line = "{} {:<12}{:<9}{:>7.2f}s{:>7}{:>7}".format('*' if i < nb_slowest else ' ', r['reference'], r['mode'], r['total'], r['nodes'], r['edges'])
+            line += "".join("{:>8.2f}s".format(r['timings'].get(s, 0.0)) for s in names)
+            print(line, file=out)
+        for s in names:
+            print("{:<20} {:8.2f}s".format(s, sum(r['timings'].get(s, 0.0) for r in trees)), file=out)
+        hits = sum(r['label_hits'] for r in trees)
+        misses = sum(r['label_misses'] for r in trees)
+        if hits + misses:
+            print("label cache          {} hits, {} misses ({:.0%} hits)".format(hits, misses, hits / (hits + misses)), file=out)
+        fallbacks = [r for r in trees if len(r.get('layouts', [])) > 1]
+        if fallbacks:
+            print("{} layouts fell back:".format(len(fallbacks)), file=out)
+            for r in fallbacks:
+                print("  {:<12}{:<9}{}".format(r['reference'], r['mode'], format_attempts(r['layouts'])), file=out)
+
+    def writeCSV(self):
+        trees, nb_slowest = self.slowest()
+        names = self.stageNames()
+        peaks = self.stageNames('memory')
+        os.makedirs(os.path.dirname(os.path.abspath(self._csvfile)), exist_ok=True)
+        with open(self._csvfile, 'w', newline='', encoding='utf8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['id', 'reference', 'mode', 'slowest_1pct', 'total', 'nodes', 'edges', 'max_rss', 'label_hits', 'label_misses', 'layout_attempts', 'layouts'] + ["{}_s".format(s) for s in names] + ["{}_peak".format(s) for s in peaks])
+            for i, r in enumerate(trees):
+                row = [r['id'], r['reference'], r['mode'], int(i < nb_slowest), "{:.6f}".format(r['total']), r['nodes'], r['edges'], r['max_rss'], r['label_hits'], r['label_misses'], len(r.get('layouts', [])) or "", format_attempts(r.get('layouts', []))]
+                row += ["{:.6f}".format(r['timings'][s]) if s in r['timings'] else "" for s in names]
+                row += [r['memory'].get(s, "") for s in peaks]
+                writer.writerow(row)
+
+def format_peak(peak):
+    if peak is None:
+        return ""
+    return " (peak {:.1f} MiB)".format(peak / 2**20)
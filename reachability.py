@@ -0,0 +1,127 @@
+# Optional dependencies of the repository, only needed for the reachability
+# queries (see AlgoIndex.getReachability, which imports this module on demand)
+import numpy as np
+from scipy import sparse
+
+from algo_graph import QUESTION, SEQUENCE, DIAGNOSIS, FINAL, ANSWER
+
+###################
+# Reachability class
+###################
+
+def dependency_matrix(graph):
+    """Sparse n x n matrix of the direct dependencies of an AlgoGraph.
+
+    Entry (i, j) is set when node i depends directly on node j: a node on
+    the answer leading to it, an answer on its question, a sequence, a
+    diagnosis or a final diagnosis on its members.
+    """
+    rows, cols = [], []
+    for i in range(graph.size()):
+        for p, a in graph.parents(i):
+            rows.append(i)
+            cols.append(a)
+        for m in graph.members(i):
+            rows.append(i)
+            cols.append(m)
+        for a in graph.answers(i):
+            rows.append(a)
+            cols.append(i)
+    n = graph.size()
+    data = np.ones(len(rows), dtype=bool)
+    return sparse.csr_matrix((data, (rows, cols)), shape=(n, n), dtype=bool)
+
+def transitive_closure(adjacency, sources):
+    """Rows of the transitive closure of adjacency for the given source nodes.
+
+    Returns a len(sources) x n boolean CSR matrix whose row k holds every node
+    reachable from sources[k] in one or more steps. All the sources advance
+    together, one sparse product per dependency level, and each row only
+    carries the nodes it has not reached yet, so cycles terminate.
+    """
+    n = adjacency.shape[0]
+    selection = sparse.csr_matrix((np.ones(len(sources), dtype=bool), (np.arange(len(sources)), sources)), shape=(len(sources), n), dtype=bool)
+    reached = sparse.csr_matrix((len(sources), n), dtype=bool)
+    frontier = selection
+    while frontier.nnz:
+        frontier = (frontier @ adjacency).astype(bool)
+        frontier = frontier > reached
+        reached = reached + frontier
+    return reached.tocsr()
+
+class Reachability():
+    """Bulk ancestor queries over the dependencies of an AlgoGraph.
+
+    The transitive closure is computed once for all final diagnoses, main
+    diagnoses and question sequences; queries are then row or column
+    lookups in that matrix. Requires NumPy and SciPy.
+    """
+
+    def __init__(self, graph):
+        self._graph = graph
+        self._adjacency = dependency_matrix(graph)
+        kinds = np.array([graph.getKind(i) for i in range(graph.size())])
+        self._masks = {kind: kinds == kind for kind in (QUESTION, SEQUENCE, DIAGNOSIS, FINAL, ANSWER)}
+        self._sources = np.flatnonzero(self._masks[FINAL] | self._masks[DIAGNOSIS] | self._masks[SEQUENCE])
+        self._row_of = {int(i): k for k, i in enumerate(self._sources)}
+        self._closure = transitive_closure(self._adjacency, self._sources)
+        self._closure_csc = self._closure.tocsc()
+
+    def getGraph(self):
+        return self._graph
+
+    def getClosure(self):
+        # Rows: final diagnoses, main diagnoses and sequences (see getSources)
+        return self._closure
+
+    def getSources(self):
+        return self._sources
+
+    def ancestors(self, n, kind=None):
+        # Graph indices of the nodes n depends on, optionally of one kind only
+        row = self._closure.getrow(self._row_of[self._graph.lookup(n)])
+        indices = row.indices
+        if kind is not None:
+            indices = indices[self._masks[kind][indices]]
+        return np.sort(indices)
+
+    def dependents(self, i, kind=None):
+        # Sources (final diagnoses, diagnoses, sequences) depending on graph index i
+        col = self._closure_csc.getcol(i)
+        indices = self._sources[col.indices]
+        if kind is not None:
+            indices = indices[self._masks[kind][indices]]
+        return np.sort(indices)
+
+    def objects(self, indices):
+        return [self._graph.getObject(int(i)) for i in indices]
+
+    def questionsReaching(self, fd):
+        # All the questions whose answers feed final diagnosis (or sequence) fd
+        return self.objects(self.ancestors(fd, QUESTION))
+
+    def sequencesReaching(self, fd):
+        return self.objects(self.ancestors(fd, SEQUENCE))
+
+    def sequencesBetween(self, q, fd):
+        # The question sequences through which question q feeds fd
+        i = self._graph.lookup(q)
+        through = self.ancestors(fd, SEQUENCE)
+        return self.objects([s for s in through if self._closure[self._row_of[int(s)], i]])
+
+    def finalDiagnosesDependingOn(self, answer_id):
+        # All the final diagnoses depending, directly or not, on an answer
+        i = self._graph.lookupAnswer(answer_id)
+        if i is None:
+            return []
+        return self.objects(self.dependents(i, FINAL))
+
+    def coverage(self):
+        """Final diagnoses x questions boolean matrix, with its row and column nodes.
+
+        Entry (f, q) is set when question q feeds final diagnosis f.
+        """
+        fds = np.flatnonzero(self._masks[FINAL][self._sources])
+        questions = np.flatnonzero(self._masks[QUESTION])
+        matrix = self._closure[fds][:, questions]
+        return matrix, self.objects(self._sources[fds]), self.objects(questions)
@@ -0,0 +1,75 @@
+import os
+import hashlib
+
+###################
+# RenderCache class
+###################
+
+def cache_dir_for(output_dir):
+    # The cache lives next to the output directory, not inside it, so that
+    # exported trees can be copied around without the bookkeeping files
+    return os.path.normpath(output_dir) + "_cache"
+
+class RenderCache():
+    """Remember the DOT source each output file was rendered from.
+
+    One small entry file per output (named after the hash of its path) holds
+    the SHA-256 of the DOT source, so concurrent workers never write to the
+    same file. An output is fresh when it exists and its entry matches the
+    hash of the graph about to be rendered. With an ArtifactStore, every
+    stored output is also deduplicated by content into the store.
+    """
+
+    def __init__(self, cache_dir, store=None):
+        self._dir = cache_dir
+        self._store = store
+        os.makedirs(self._dir, exist_ok=True)
+
+    def getStore(self):
+        return self._store
+
+    def getDir(self):
+        return self._dir
+
+    def _entry(self, outfile):
+        name = hashlib.sha1(os.path.abspath(outfile).encode('utf8')).hexdigest()
+        return os.path.join(self._dir, name)
+
+    def isFresh(self, outfile, source):
+        if not os.path.exists(outfile):
+            return False
+        try:
+            with open(self._entry(outfile), encoding='utf8') as f:
+                digest = f.readline().strip()
+        except FileNotFoundError:
+            return False
+        return digest == hash_source(source)
+
+    def store(self, outfile, source):
+        entry = self._entry(outfile)
+        tmpfile = "{}.{}.tmp".format(entry, os.getpid())
+        with open(tmpfile, 'w', encoding='utf8') as f:
+            f.write("{}\n{}\n".format(hash_source(source), os.path.abspath(outfile)))
+        os.replace(tmpfile, entry)
+        if self._store is not None:
+            self._store.add(outfile)
+
+    def release(self, outfiles):
+        # Called before (re)rendering outputs, which may be links into the store
+        if self._store is not None:
+            for outfile in outfiles:
+                self._store.release(outfile)
+
+    def storeAll(self, outfiles, source):
+        for outfile in outfiles:
+            self.store(outfile, source)
+
+    def storeLayout(self, outfiles, source, attempts):
+        # Outputs of a LayoutScheduler layout, only recorded when the first
+        # attempt succeeded: a layout that fell back to cheaper attributes or
+        # engines is retried at full quality by the next run
+        if len(attempts) == 1:
+            self.storeAll(outfiles, source)
+
+def hash_source(source):
+    return hashlib.sha256(source.encode('utf8')).hexdigest()
@@ -0,0 +1,86 @@
+import os
+import sys
+import pickle
+import hashlib
+
+###################
+# Algorithm snapshot
+###################
+
+# Bump when the layout of the snapshot content changes
+SNAPSHOT_VERSION = 1
+
+# epoct objects reference each other deeply; pickle recurses along the links
+RECURSION_LIMIT = 20000
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def source_stamps(sources):
+    # Size and mtime of each source file, the hash being computed lazily
+    stamps = []
+    for path in sources:
+        st = os.stat(path)
+        stamps.append({'path': os.path.abspath(path), 'size': st.st_size, 'mtime': st.st_mtime_ns, 'sha256': None})
+    return stamps
+
+def is_valid(header, stamps):
+    """Tell whether a snapshot header matches the current source files.
+
+    A file with the recorded size and mtime is taken as unchanged; otherwise
+    its content hash decides, so that touching a file without editing it does
+    not discard the snapshot.
+    """
+    if header.get('version') != SNAPSHOT_VERSION:
+        return False
+    recorded = header.get('sources', [])
+    if [s['path'] for s in recorded] != [s['path'] for s in stamps]:
+        return False
+    for old, new in zip(recorded, stamps):
+        if old['size'] == new['size'] and old['mtime'] == new['mtime']:
+            new['sha256'] = old['sha256']
+            continue
+        if old['size'] != new['size']:
+            return False
+        new['sha256'] = file_hash(new['path'])
+        if new['sha256'] != old['sha256']:
+            return False
+    return True
+
+def load_snapshot(snapshot_file, sources, build):
+    """Return build(), cached in snapshot_file as long as sources are unchanged.
+
+    The file holds two pickles: a small header describing the source files
+    (checked first, without reading the data) and the object returned by
+    build(). A stale, missing or unreadable snapshot is rebuilt and rewritten.
+    """
+    stamps = source_stamps(sources)
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, RECURSION_LIMIT))
+    try:
+        try:
+            with open(snapshot_file, 'rb') as f:
+                if is_valid(pickle.load(f), stamps):
+                    return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            pass
+        # Hash the sources before building, so that an edit made meanwhile
+        # leaves a snapshot that will be found stale
+        for s in stamps:
+            if s['sha256'] is None:
+                s['sha256'] = file_hash(s['path'])
+        data = build()
+        header = {'version': SNAPSHOT_VERSION, 'sources': stamps}
+        os.makedirs(os.path.dirname(os.path.abspath(snapshot_file)), exist_ok=True)
+        tmpfile = "{}.{}.tmp".format(snapshot_file, os.getpid())
+        with open(tmpfile, 'wb') as f:
+            pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpfile, snapshot_file)
+        return data
+    finally:
+        sys.setrecursionlimit(limit)
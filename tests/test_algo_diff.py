@@ -0,0 +1,118 @@
+"""Tests of algo_diff on small hand-built algorithms.
+
+Run from the repository root, where libs is importable:
+
+    python -m unittest discover tests
+"""
+import unittest
+
+from libs import epoct
+from algo_index import AlgoIndex
+from algo_diff import AlgoDiff
+from benchmarks.synthetic import Generator, ChiefComplaint, make_node
+
+def node(node_id, **fields):
+    return {'id': node_id, 'label': {'en': "node {}".format(node_id)}, **fields}
+
+class Algorithm():
+    # A chief complaint, one main diagnosis with one final diagnosis and a few
+    # questions and sequences, linked by hand
+    def __init__(self):
+        gen = Generator(0)
+        self.q1 = gen.question(1, 2)
+        self.q2 = gen.question(2, 2)
+        self.q3 = gen.question(3, 2)
+        self.q4 = gen.question(4, 2)
+        # parent sequence of the root sequence, with a member depending on q4
+        self.member = gen.question(5, 2)
+        self.link(self.member, self.q4)
+        self.parent_seq = gen.sequence(1, [self.member])
+        self.link(self.parent_seq, self.q3)
+        self.root_seq = gen.sequence(2, [self.q2])
+        self.link(self.root_seq, self.parent_seq)
+        self.link(self.q2, self.q1)
+        self.cc = make_node(ChiefComplaint, gen.newID(), "CC", "Chief complaint")
+        self.md = make_node(epoct.DiagnosisSequence, gen.newID(), "DS", "Diagnosis", getSeq=[self.q1], getChiefComplaint=self.cc)
+        self.fd = make_node(epoct.FinalDiagnosis, gen.newID(), "DF", "Final diagnosis", getMainDiagnosis=self.md)
+        self.link(self.fd, self.q2)
+        self.index = AlgoIndex([self.md], [self.fd], [self.parent_seq, self.root_seq])
+
+    def link(self, n, parent):
+        n.getGrandParents().append(parent)
+        n.getParents().append(parent.getChildren()[0])
+
+    def sections(self, **changed):
+        # JSON sections of the algorithm, with the given node entries replaced
+        nodes = {str(n.getID()): node(n.getID()) for n in (self.q1, self.q2, self.q3, self.q4, self.member, self.parent_seq, self.root_seq)}
+        nodes.update(changed)
+        return {
+            'nodes': nodes,
+            'diagnostics': {str(self.md.getID()): node(self.md.getID())},
+            'final_diagnostics': {str(self.fd.getID()): node(self.fd.getID())},
+        }
+
+class TestAlgoDiff(unittest.TestCase):
+
+    def test_changed_answers(self):
+        old = {'nodes': {'1': node(1, answers={'10': node(10), '11': node(11)})}}
+        new = {'nodes': {'1': node(1, answers={'10': node(10, label="yes"), '12': node(12)})}}
+        diff = AlgoDiff(old, new)
+        self.assertEqual(diff.changedIDs(), {1})
+        self.assertEqual(diff.nodeStatus(1), 'changed')
+        self.assertEqual(diff.answerStatus(1, 10), 'changed')
+        self.assertEqual(diff.answerStatus(1, 12), 'added')
+        self.assertEqual(diff.removedAnswers(1), [(11, "node 11")])
+
+    def test_id_shared_by_sections(self):
+        # The entry of one section changes, that of the other does not
+        old = {'nodes': {'5': node(5)}, 'diagnostics': {'5': node(5, instances=[1])}}
+        new = {'nodes': {'5': node(5, label="new label")}, 'diagnostics': {'5': node(5, instances=[1])}}
+        diff = AlgoDiff(old, new)
+        self.assertEqual(diff.changedIDs(), {5})
+        self.assertEqual(diff.nodeStatus(5), 'changed')
+        # Reversed: the other section changes
+        diff = AlgoDiff(new, {'nodes': new['nodes'], 'diagnostics': {'5': node(5, instances=[2])}})
+        self.assertEqual(diff.changed, {5})
+
+    def test_id_added_to_another_section(self):
+        old = {'nodes': {'5': node(5)}}
+        new = {'nodes': {'5': node(5)}, 'final_diagnostics': {'5': node(5)}}
+        diff = AlgoDiff(old, new)
+        self.assertEqual(diff.added, set())
+        self.assertEqual(diff.changed, {5})
+        diff = AlgoDiff(new, old)
+        self.assertEqual(diff.removed, set())
+        self.assertEqual(diff.changed, {5})
+
+    def test_unchanged(self):
+        algo = Algorithm()
+        diff = AlgoDiff(algo.sections(), algo.sections())
+        self.assertEqual(diff.changedIDs(), set())
+        self.assertEqual(diff.affected([algo.root_seq, algo.parent_seq], algo.index, "full"), [])
+
+    def test_affected_short(self):
+        algo = Algorithm()
+        q1 = algo.q1.getID()
+        diff = AlgoDiff(algo.sections(), algo.sections(**{str(q1): node(q1, label="changed")}))
+        # q1 is a parent of q2, member of the root sequence, and of the main diagnosis
+        self.assertEqual(diff.affected([algo.root_seq, algo.parent_seq], algo.index, "short"), [algo.root_seq])
+        self.assertEqual(diff.affected([algo.fd], algo.index, "short"), [])
+
+    def test_affected_full(self):
+        algo = Algorithm()
+        q4 = algo.q4.getID()
+        diff = AlgoDiff(algo.sections(), algo.sections(**{str(q4): node(q4, label="changed")}))
+        # q4 is only drawn in full trees, through the members of the parent sequence
+        self.assertEqual(diff.affected([algo.root_seq], algo.index, "short"), [])
+        self.assertEqual(diff.affected([algo.root_seq, algo.parent_seq], algo.index, "full"), [algo.root_seq, algo.parent_seq])
+
+    def test_affected_mdfocus(self):
+        algo = Algorithm()
+        q2 = algo.q2.getID()
+        diff = AlgoDiff(algo.sections(), algo.sections(**{str(q2): node(q2, label="changed")}))
+        # q2 is a parent of the final diagnosis; chief complaints have the trees of their diagnoses
+        self.assertEqual(diff.affected([algo.md], algo.index, "mdfocus"), [algo.md])
+        self.assertEqual(diff.affected([algo.cc], algo.index, "mdfocus"), [algo.cc])
+
+if __name__ == '__main__':
+    unittest.main()
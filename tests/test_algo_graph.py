@@ -0,0 +1,96 @@
+"""Tests of the AlgoGraph views against the trees drawn by the walk.
+
+Run from the repository root, where libs is importable:
+
+    python -m unittest discover tests
+"""
+import unittest
+
+import generate_trees
+from libs import epoct
+from algo_index import AlgoIndex
+from benchmarks.synthetic import synthetic_algorithm, Generator, ChiefComplaint, make_node
+
+def tree(index, n, mode, builder):
+    g = generate_trees.ClinicalAlgo(index, horizontal=False, builder=builder)
+    g.buildTree(n, mode)
+    return records(g)
+
+def merged(index, final_diagnoses, builder):
+    g = generate_trees.ClinicalAlgo(index, horizontal=False, builder=builder)
+    g.addMergedDiagnoses(final_diagnoses)
+    return records(g)
+
+def link(n, parent):
+    n.getGrandParents().append(parent)
+    n.getParents().append(parent.getChildren()[0])
+
+def records(g):
+    nodes = {r.id: (r.label, r.shape, r.color, r.answer_indices) for r in g.getNodes()}
+    edges = {e.key: (e.id1, e.id2, e.tailport, e.headport, e.style, e.label) for e in g.getEdges()}
+    return nodes, edges
+
+class TestAlgoGraph(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.mds, cls.fds, cls.ccs, cls.qss = synthetic_algorithm(n_cc=2, mds_per_cc=3, n_questions=120, n_sequences=12, seed=3)
+        # Final diagnoses have the sequence of their main diagnosis, drawn by merged trees
+        for fd in cls.fds:
+            fd.getSeq().extend(fd.getMainDiagnosis().getSeq())
+        cls.index = AlgoIndex(cls.mds, cls.fds, cls.qss)
+
+    def test_short_views(self):
+        for n in self.qss + self.fds + self.mds:
+            with self.subTest(node=n.getReference()):
+                self.assertEqual(tree(self.index, n, "short", 'graph'), tree(self.index, n, "short", 'walk'))
+
+    def test_mdfocus_views(self):
+        for n in self.mds + self.ccs:
+            with self.subTest(node=n.getReference()):
+                self.assertEqual(tree(self.index, n, "mdfocus", 'graph'), tree(self.index, n, "mdfocus", 'walk'))
+
+    def test_merged_view(self):
+        for k in range(0, len(self.fds), 5):
+            final_diagnoses = self.fds[k:k + 5]
+            with self.subTest(first=final_diagnoses[0].getReference()):
+                self.assertEqual(merged(self.index, final_diagnoses, 'graph'), merged(self.index, final_diagnoses, 'walk'))
+
+    def test_member_types(self):
+        # A management sequence and a Question2 in the sequence of a diagnosis,
+        # and a question depending on a management Question2
+        gen = Generator(0)
+        q1, q2 = gen.question(1, 2), gen.question(2, 2)
+        seq = make_node(epoct.QuestionSequence, gen.newID(), "QS", "Management sequence", getCategory='management', getChildren=gen.answers(["yes", "no"]))
+        link(seq, q1)
+        other = make_node(epoct.Question2, gen.newID(), "Q2", "Question2", getChildren=gen.answers(["yes", "no"]))
+        link(other, q2)
+        management = make_node(epoct.Question2, gen.newID(), "Q2", "Management Question2", getCategory='management', getChildren=gen.answers(["yes", "no"]))
+        q3 = make_node(epoct.Question, gen.newID(), "Q", "Question", getChildren=gen.answers(["yes", "no"]))
+        link(q3, q1)
+        link(q3, management)
+        cc = make_node(ChiefComplaint, gen.newID(), "CC", "Chief complaint")
+        md = make_node(epoct.DiagnosisSequence, gen.newID(), "DS", "Diagnosis", getSeq=[seq, other, q3], getChiefComplaint=cc)
+        fd = make_node(epoct.FinalDiagnosis, gen.newID(), "DF", "Final diagnosis", getSeq=[seq, other, q3], getMainDiagnosis=md)
+        link(fd, q2)
+        index = AlgoIndex([md], [fd], [seq])
+        nodes, edges = tree(index, md, "short", 'walk')
+        # The sequence and q3 on q1
+        self.assertEqual(len(edges), 2)
+        self.assertEqual(tree(index, md, "short", 'graph'), (nodes, edges))
+        self.assertEqual(tree(index, md, "mdfocus", 'graph'), tree(index, md, "mdfocus", 'walk'))
+        self.assertEqual(merged(index, [fd], 'graph'), merged(index, [fd], 'walk'))
+
+    def test_no_full_view(self):
+        with self.assertRaises(ValueError):
+            self.index.getGraph().view(self.qss[0], "full")
+        with self.assertRaises(ValueError):
+            generate_trees.plot_nodes(self.qss, self.index, "unused", "full", builder='graph')
+
+    def test_unknown_node(self):
+        other = make_node(ChiefComplaint, -1, "CC", "Not in the algorithm")
+        with self.assertRaises(KeyError):
+            self.index.getGraph().view(other, "short")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+"""Tests of the artifact store against files rewritten in place.
+
+Run from the repository root:
+
+    python -m unittest discover tests
+"""
+import os
+import pickle
+import tempfile
+import unittest
+
+from artifact_store import ArtifactStore
+from render_cache import RenderCache
+from snapshot import file_hash
+
+def write(path, content):
+    # Rewritten in place, as the renderers do
+    with open(path, 'wb') as f:
+        f.write(content)
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+class TestArtifactStore(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.dir = self._tmp.name
+        self.store = ArtifactStore(os.path.join(self.dir, "artifacts"))
+        self.src = os.path.join(self.dir, "node001-full.png")
+        self.dest = os.path.join(self.dir, "D001.png")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def objects(self):
+        return [os.path.join(root, name) for root, dirs, files in os.walk(self.store.getDir()) for name in files]
+
+    def test_source_rewritten(self):
+        write(self.src, b"first render")
+        self.store.export(self.src, self.dest)
+        write(self.src, b"second render")
+        self.assertEqual(read(self.dest), b"first render")
+        for obj in self.objects():
+            self.assertEqual(os.path.basename(obj), file_hash(obj))
+
+    def test_added_file_rewritten(self):
+        write(self.src, b"render")
+        digest = self.store.add(self.src)
+        write(self.src, b"other render")
+        self.assertEqual(read(self.store.objectPath(digest)), b"render")
+
+    def test_prune(self):
+        write(self.src, b"first render")
+        self.store.export(self.src, self.dest)
+        write(self.src, b"second render")
+        self.store.add(self.src)
+        # The object of the second render is not exported; that of the first
+        # is kept when the export is a hardlink to it
+        exported = 1 if os.stat(self.dest).st_nlink > 1 else 0
+        self.assertEqual(self.store.prune(), 2 - exported)
+        self.assertEqual(len(self.objects()), exported)
+        self.assertEqual(read(self.dest), b"first render")
+
+    def test_pickle(self):
+        # Sent to spawned render_batch workers inside a RenderCache
+        cache = pickle.loads(pickle.dumps(RenderCache(os.path.join(self.dir, "cache"), self.store)))
+        write(self.src, b"render")
+        cache.getStore().export(self.src, self.dest)
+        self.assertEqual(read(self.dest), b"render")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+"""Tests of the process-wide label cache across algorithms.
+
+Run from the repository root, where libs is importable:
+
+    python -m unittest discover tests
+"""
+import unittest
+
+import generate_trees
+from algo_index import AlgoIndex
+from label_cache import LABELS
+from benchmarks.synthetic import synthetic_algorithm, Value
+
+def labels(index, nodes, mode):
+    result = {}
+    for n in nodes:
+        g = generate_trees.ClinicalAlgo(index, horizontal=False)
+        g.buildTree(n, mode)
+        g.buildLabels()
+        result[n.getID()] = sorted((r.id, r.label) for r in g.getNodes())
+    return result
+
+def algorithm(prefix):
+    # The same synthetic algorithm, its labels prefixed: same IDs, other labels
+    mds, fds, ccs, qss = synthetic_algorithm(n_cc=2, mds_per_cc=2, n_questions=60, n_sequences=6, seed=1)
+    index = AlgoIndex(mds, fds, qss)
+    for i in range(index.getGraph().size()):
+        n = index.getGraph().getObject(i)
+        n.getLabel = Value(prefix + n.getLabel())
+        n.displaySequenceText = Value(prefix + n.displaySequenceText())
+    return index, qss + mds
+
+class TestLabelCache(unittest.TestCase):
+
+    def test_two_algorithms(self):
+        index1, nodes1 = algorithm("first ")
+        index2, nodes2 = algorithm("second ")
+        LABELS.clear()
+        expected = labels(index2, nodes2, "short")
+        LABELS.clear()
+        labels(index1, nodes1, "short")
+        self.assertEqual(labels(index2, nodes2, "short"), expected)
+
+    def test_same_algorithm(self):
+        index, nodes = algorithm("")
+        LABELS.clear()
+        labels(index, nodes, "short")
+        misses = LABELS.misses
+        labels(index, nodes, "short")
+        self.assertEqual(LABELS.misses, misses)
+
+if __name__ == '__main__':
+    unittest.main()
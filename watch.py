@@ -0,0 +1,125 @@
+import os
+import time
+import traceback
+
+from json_stream import load_sections, NODE_SECTIONS
+from algo_diff import AlgoDiff
+
+###################
+# FileWatcher class
+###################
+
+def file_stamp(path):
+    # Size and mtime of path, None while it is missing (editors replacing it)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+def file_stamps(paths):
+    return {p: file_stamp(p) for p in paths}
+
+class FileWatcher():
+    """Wait for changes of a set of files, polling their size and mtime.
+
+    A change is reported once the files have stayed the same for debounce
+    seconds, so that the repeated saves of an export, or a file written in
+    several steps, give a single change. Polling needs no extra dependency and
+    works the same on network drives, where change notifications are not
+    reliable.
+    """
+
+    def __init__(self, paths, debounce=2.0, interval=0.5, stamps=None):
+        # stamps (see file_stamps) are those of the version already handled,
+        # taken now when None
+        self._paths = list(paths)
+        self._debounce = debounce
+        self._interval = interval
+        self._stamps = stamps if stamps is not None else self.stamps()
+
+    def stamps(self):
+        return file_stamps(self._paths)
+
+    def wait(self):
+        # Block until some files change, then until they settle; return the changed paths
+        current = self._stamps
+        while current == self._stamps:
+            time.sleep(self._interval)
+            current = self.stamps()
+        settled = time.monotonic()
+        while time.monotonic() - settled < self._debounce:
+            time.sleep(self._interval)
+            stamps = self.stamps()
+            if stamps != current:
+                current = stamps
+                settled = time.monotonic()
+        changed = {p for p in self._paths if current[p] != self._stamps[p]}
+        self._stamps = current
+        return changed
+
+    def changes(self):
+        while True:
+            yield self.wait()
+
+###################
+# Algorithm watch
+###################
+
+def node_sections(data, sections=NODE_SECTIONS):
+    # The node sections of a loaded algorithm, all AlgoDiff reads
+    return {s: data[s] for s in sections if s in data}
+
+def read_baseline(json_path, key_paths, load=load_sections):
+    """Return the data of json_path, read by load, and the stamps of the files.
+
+    The stamps are taken first: a watch_algorithm started from this baseline
+    sees any change saved from then on, like during a first render of data.
+    """
+    stamps = file_stamps([json_path] + list(key_paths))
+    return load(json_path), stamps
+
+def watch_algorithm(json_path, key_paths, update, debounce=2.0, interval=0.5, load=load_sections, baseline=None):
+    """Call update(diff, data) after each change of the algorithm files, until interrupted.
+
+    json_path is read once per change by load(json_path) (by default only its
+    metadata and node sections), and data, the result, is handed to update to
+    build the new model from the same parse as the diff. The node sections
+    are kept from one change to the next to compute the AlgoDiff of each
+    change: a change that leaves every node the same (metadata, media) renders
+    nothing. A change of key_paths (the clinical keys) can alter any tree, so
+    it gives a diff of None: every tree is re-rendered. A change that cannot
+    be loaded, like a file still being exported, is reported and the previous
+    version kept.
+    baseline, the (data, stamps) of read_baseline, is the version already
+    rendered (read when None): the changes saved since are rendered at once.
+    """
+    if baseline is None:
+        baseline = read_baseline(json_path, key_paths, load)
+    data, stamps = baseline
+    sections = node_sections(data)
+    watcher = FileWatcher([json_path] + list(key_paths), debounce, interval, stamps)
+    print("Watching {} (Ctrl+C to stop)".format(", ".join([json_path] + list(key_paths))))
+    try:
+        for changed in watcher.changes():
+            start = time.perf_counter()
+            try:
+                data = load(json_path)
+                new_sections = node_sections(data)
+                diff = None
+                if not changed & set(key_paths):
+                    diff = AlgoDiff(sections, new_sections)
+                    if not diff.changedIDs():
+                        print("No node changed in {}".format(json_path))
+                        sections = new_sections
+                        continue
+                    print("{} added, {} removed, {} changed nodes".format(len(diff.added), len(diff.removed), len(diff.changed)))
+                update(diff, data)
+                sections = new_sections
+            except Exception:
+                traceback.print_exc()
+                print("Keeping the previous version of the algorithm")
+                continue
+            print("Updated in {:.1f}s".format(time.perf_counter() - start))
+    except KeyboardInterrupt:
+        pass